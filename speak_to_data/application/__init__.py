@@ -1,14 +1,22 @@
-import csv
+import asyncio
+import os
 from pathlib import Path
+from typing import Optional
 
 import spacy
 from speak_to_data.application import (
+    aggregates,
     config,
     events,
+    jobs,
+    map_reduce,
     prepare_for_model,
     query_parser,
     response_parser,
+    retry,
+    single_flight,
     app_data_loader,
+    table_budget,
 )
 from speak_to_data import communication
 
@@ -18,24 +26,142 @@ QueryData = query_parser.QueryData
 AppDataLoader = app_data_loader.AppDataLoader
 Response = response_parser.Response
 
+communication.writer.configure(
+    communication.writer.WriterSettings(
+        fsync_policy=config.WRITE_FSYNC_POLICY,
+        max_batch_rows=config.WRITE_MAX_BATCH_ROWS,
+        max_batch_delay=config.WRITE_MAX_BATCH_DELAY,
+        idle_timeout=config.WRITE_IDLE_TIMEOUT,
+    )
+)
+communication.network.configure(
+    communication.network.ResilienceSettings(
+        failure_threshold=config.MODEL_BREAKER_FAILURES,
+        slow_call=config.MODEL_BREAKER_SLOW_CALL,
+        reset_timeout=config.MODEL_BREAKER_RESET_TIMEOUT,
+        max_concurrent_calls=config.MODEL_BULKHEAD_SIZE,
+        max_wait=config.MODEL_BULKHEAD_MAX_WAIT,
+        calls_per_second=config.MODEL_CALLS_PER_SECOND,
+        burst=config.MODEL_CALL_BURST,
+        max_queue=config.MODEL_CALL_QUEUE_SIZE,
+        max_queue_wait=config.MODEL_CALL_MAX_QUEUE_WAIT,
+    )
+)
+communication.event_store.seed_vocabulary(communication.read_json(config.APP_DATA_PATH))
+response_cache = communication.ResponseCache(
+    config.RESPONSE_CACHE_SIZE, config.RESPONSE_CACHE_TTL, config.RESPONSE_CACHE_DIR
+)
+table_cache = communication.ResponseCache(config.TABLE_CACHE_SIZE, float("inf"))
+# Identical requests asked at the same time share one model call
+model_calls = single_flight.SingleFlight()
+query_jobs = (
+    jobs.JobQueue(
+        config.QUERY_JOB_WORKERS,
+        config.QUERY_JOB_HISTORY,
+        config.QUERY_JOB_QUEUE_SIZE,
+    )
+    if config.QUERY_JOB_WORKERS
+    else None
+)
+
+
+def persistence_backend():
+    return communication.BACKENDS[config.PERSISTENCE_BACKEND]
+
 
 def initial_setup() -> None:
     erp: Path = config.EVENT_RECORDS_PATH
-    if not erp.is_file():
-        fieldnames = config.FIELD_NAMES
-        try:
-            with open(erp, "w", newline="") as event_record:
-                w = csv.DictWriter(event_record, fieldnames=fieldnames, dialect="unix")
-                w.writeheader()
-        except OSError:
-            pass
+    try:
+        persistence_backend().initialise_store(erp, config.FIELD_NAMES)
+    except OSError:
+        pass
+
+
+def migrate_csv_to_sqlite() -> int:
+    """One-shot copy of the CSV event records into the SQLite backend"""
+    return communication.sqlite_store.migrate_from_csv(
+        config.CSV_EVENT_RECORDS_PATH,
+        config.SQLITE_EVENT_RECORDS_PATH,
+        config.FIELD_NAMES,
+    )
+
+
+def partition_csv_events() -> int:
+    """Split the CSV event records into monthly files for the partitioned backend"""
+    return communication.partitions.split_into_partitions(
+        config.CSV_EVENT_RECORDS_PATH,
+        config.PARTITIONED_EVENT_RECORDS_PATH,
+        config.FIELD_NAMES,
+    )
+
+
+def compact_events() -> int:
+    """Fold the event records into binary snapshots so they load without parsing"""
+    backend = persistence_backend()
+    if not hasattr(backend, "compact"):
+        raise ValueError(
+            f"The {config.PERSISTENCE_BACKEND} backend does not support compaction"
+        )
+    return backend.compact(config.EVENT_RECORDS_PATH)
+
+
+def vectorised_queries() -> bool:
+    """Whether model tables are built with the NumPy execution mode"""
+    return (
+        config.QUERY_ENGINE == "numpy"
+        and config.PERSISTENCE_BACKEND == "csv"
+        and communication.vectorised.AVAILABLE
+    )
+
+
+def data_generation(
+    events_path: Path, event_filter: Optional[communication.EventFilter] = None
+) -> int:
+    """Goes up whenever events the filter may match are recorded, compacted or imported
+
+    Backends that split events by month only look at the months in the filter's
+    date range.
+    """
+    return persistence_backend().data_generation(events_path, event_filter)
+
+
+def model_ready_dataset(query_data: QueryData, events_path: Path) -> dict:
+    """The table for a query, reused until the events at the path change"""
+    key = communication.response_cache.cache_key(
+        str(events_path),
+        {
+            "crops": sorted(query_data.crops),
+            "actions": sorted(query_data.actions),
+            "locations": sorted(query_data.locations),
+            "columns": sorted(query_data.columns),
+            "date_range": list(query_data.parsed_date.date_range),
+        },
+    )
+    generation = data_generation(
+        events_path, prepare_for_model.event_filter(query_data)
+    )
+    table = table_cache.get(key, generation)
+    if table is None:
+        table = _filter_events(query_data, events_path)
+        table_cache.put(key, table, generation)
+    return table
+
+
+def _filter_events(query_data: QueryData, events_path: Path) -> dict:
+    if vectorised_queries():
+        return prepare_for_model.generate_vectorised_dataset(
+            communication.read_columns(events_path), query_data
+        )
+    dataset = persistence_backend().read_dataset(
+        events_path, prepare_for_model.event_filter(query_data)
+    )
+    return prepare_for_model.generate_model_ready_dataset(dataset, query_data)
 
 
 def generate_request_object(query_data: QueryData, events_path: Path) -> dict:
     altered_query = query_data.crux
-    dataset = communication.read_dataset(events_path)
-    altered_dataset = prepare_for_model.generate_model_ready_dataset(
-        dataset, query_data
+    altered_dataset = table_budget.fit_to_budget(
+        model_ready_dataset(query_data, events_path), config.MODEL_TABLE_TOKEN_BUDGET
     )
 
     return {
@@ -50,8 +176,145 @@ def generate_request_object(query_data: QueryData, events_path: Path) -> dict:
     }
 
 
+def answer_query(user_query: str) -> str:
+    """What to tell the user about their query, from parsing to the model's answer"""
+    query_data = QueryData(user_query)
+    if not query_data:
+        # Let the user know to change their query
+        return query_data.parsed_date.warning
+    request_object = generate_request_object(query_data, config.EVENT_RECORDS_PATH)
+    return str(Response(answer_request(request_object)))
+
+
+def answer_queries(user_queries: list[str]) -> list[str]:
+    """answer_query for many queries at once, with their model calls in flight together
+
+    Up to config.MODEL_MAX_CONCURRENT_CALLS model calls are in flight at once,
+    sent from worker threads through the shared session. Tables are sent to the model whole, without splitting them up.
+    """
+    responses: list[Optional[str]] = []
+    request_objects = []
+    for user_query in user_queries:
+        query_data = QueryData(user_query)
+        if query_data:
+            responses.append(None)
+            request_objects.append(
+                generate_request_object(query_data, config.EVENT_RECORDS_PATH)
+            )
+        else:
+            responses.append(query_data.parsed_date.warning)
+    model_responses = iter(asyncio.run(answer_requests_async(request_objects)))
+    return [
+        response if response is not None else str(Response(next(model_responses)))
+        for response in responses
+    ]
+
+
+def answer_request(request_object: dict) -> dict:
+    """Answer sum queries locally and ask the TaPas model everything else
+
+    Model answers are cached by question and table, so asking again over
+    unchanged data doesn't call the model, and requests asked while the same
+    one is with the model wait for its answer. A model that is still loading is
+    retried until config.MODEL_RETRY_DEADLINE, then a warming-up error is returned.
+    """
+    key = _answer_key(request_object)
+    known_answer = _known_answer(request_object, key)
+    if known_answer is not None:
+        return known_answer
+
+    def ask_model() -> dict:
+        model_answer = retry.call_with_retries(
+            call_tapas_on_hf, request_object, model_retry_policy()
+        )
+        _remember_answer(key, model_answer)
+        return model_answer
+
+    return model_calls.do(key, ask_model)
+
+
+async def answer_requests_async(request_objects: list[dict]) -> list[dict]:
+    """answer_request for many requests, with their model calls in flight together"""
+    tapas_interface = communication.AsyncTapasInterface(
+        config.SECRETS["huggingface_api_token"],
+        timeout=(config.MODEL_CONNECT_TIMEOUT, config.MODEL_READ_TIMEOUT),
+        max_concurrency=config.MODEL_MAX_CONCURRENT_CALLS,
+    )
+
+    async def answer(request_object: dict) -> dict:
+        key = _answer_key(request_object)
+        known_answer = _known_answer(request_object, key)
+        if known_answer is not None:
+            return known_answer
+
+        async def ask_model() -> dict:
+            model_answer = await retry.call_with_retries_async(
+                tapas_interface.call_model_api, request_object, model_retry_policy()
+            )
+            _remember_answer(key, model_answer)
+            return model_answer
+
+        return await model_calls.do_async(key, ask_model)
+
+    try:
+        return list(await asyncio.gather(*map(answer, request_objects)))
+    finally:
+        tapas_interface.close()
+
+
+def _answer_key(request_object: dict) -> str:
+    return communication.response_cache.cache_key(
+        request_object["inputs"]["query"], request_object["inputs"]["table"]
+    )
+
+
+def _known_answer(request_object: dict, key: str) -> Optional[dict]:
+    """The local answer to a sum query, or the model's cached answer, if any"""
+    local_answer = aggregates.answer_locally(request_object)
+    if local_answer is not None:
+        return local_answer
+    return response_cache.get(key)
+
+
+def _remember_answer(key: str, model_answer: dict) -> None:
+    if "answer" in model_answer:
+        response_cache.put(key, model_answer)
+
+
+def runtime_stats() -> dict:
+    """Counters of the response cache, shared model calls and model rate limits
+
+    The rate limiter's figures include its queue depth and wait times. Each
+    server process keeps its own counters, so they come with the process id.
+    """
+    return {
+        "pid": os.getpid(),
+        "response_cache": response_cache.stats()._asdict(),
+        "shared_model_calls": model_calls.shared,
+        "rate_limiter": communication.network.shared_rate_limiter().stats()._asdict(),
+        "circuit": communication.network.shared_breaker().state,
+    }
+
+
+def model_retry_policy() -> retry.RetryPolicy:
+    return retry.RetryPolicy(
+        initial_delay=config.MODEL_RETRY_INITIAL_DELAY,
+        max_delay=config.MODEL_RETRY_MAX_DELAY,
+        jitter=config.MODEL_RETRY_JITTER,
+        deadline=config.MODEL_RETRY_DEADLINE,
+    )
+
+
 def call_tapas_on_hf(request_object: dict) -> dict:
     tapas_interface = communication.TapasInterface(
-        config.SECRETS["huggingface_api_token"]
+        config.SECRETS["huggingface_api_token"],
+        timeout=(config.MODEL_CONNECT_TIMEOUT, config.MODEL_READ_TIMEOUT),
+    )
+    if config.MODEL_TABLE_TOKEN_BUDGET is None or not config.MODEL_MAX_PARALLEL_CALLS:
+        return tapas_interface.call_model_api(request_object)
+    return map_reduce.call_in_chunks(
+        request_object,
+        tapas_interface.call_model_api,
+        config.MODEL_TABLE_TOKEN_BUDGET,
+        config.MODEL_MAX_PARALLEL_CALLS,
     )
-    return tapas_interface.call_model_api(request_object)
@@ -0,0 +1,86 @@
+import re
+from typing import NamedTuple, Optional
+
+from speak_to_data.application import query_parser
+
+# Column summed for each crux the executor can answer itself
+SUM_COLUMNS = {
+    query_parser.QUANTITY_SUM_CRUX: "quantity",
+    query_parser.DURATION_SUM_CRUX: "duration",
+}
+# A number followed by an optional unit, like "600gr", "18 plants" or "30"
+_MEASUREMENT = re.compile(r"\s*(\d+(?:\.\d*)?)(\s*)(.*?)\s*")
+
+
+class Measurement(NamedTuple):
+    number: float
+    # Written between the number and the unit: a space or nothing
+    separator: str
+    unit: str
+
+    def __str__(self) -> str:
+        number = self.number
+        text = str(int(number)) if number.is_integer() else str(round(number, 3))
+        return f"{text}{self.separator}{self.unit}"
+
+
+def parse_measurement(value: str) -> Optional[Measurement]:
+    """Split a value like "600gr" into its number and unit, None if it has no number"""
+    match = _MEASUREMENT.fullmatch(value)
+    if not match:
+        return None
+    number, separator, unit = match.groups()
+    return Measurement(float(number), separator and " ", unit)
+
+
+def sum_measurements(measurements: list[Measurement]) -> list[Measurement]:
+    """Total per unit, in the order the units first occur"""
+    totals: dict[str, Measurement] = dict()
+    for measurement in measurements:
+        total = totals.get(measurement.unit)
+        if total:
+            measurement = total._replace(number=total.number + measurement.number)
+        totals[measurement.unit] = measurement
+    return list(totals.values())
+
+
+def answer_locally(request_object: dict) -> Optional[dict]:
+    """Answer sum queries from the table itself, in the shape TaPas answers in
+
+    Returns None for any query this executor cannot answer, including sums over
+    values that don't start with a number; those still go to the model. Values
+    with different units are summed per unit.
+    """
+    query = request_object["inputs"]["query"]
+    table: dict[str, list[str]] = request_object["inputs"]["table"]
+    if query not in SUM_COLUMNS:
+        return None
+    if not table:
+        return {
+            "error": "table is empty",
+            "warnings": ["There was an inference error: table is empty"],
+        }
+    column = SUM_COLUMNS[query]
+    if column not in table:
+        return None
+
+    column_index = list(table).index(column)
+    measurements, coordinates, cells = [], [], []
+    for row, value in enumerate(table[column]):
+        if not value:
+            continue
+        measurement = parse_measurement(value)
+        if not measurement:
+            return None
+        measurements.append(measurement)
+        coordinates.append([row, column_index])
+        cells.append(value)
+    if not cells:
+        return None
+
+    return {
+        "answer": ", ".join(str(total) for total in sum_measurements(measurements)),
+        "coordinates": coordinates,
+        "cells": cells,
+        "aggregator": "SUM",
+    }
@@ -4,7 +4,82 @@ from pathlib import Path
 SECRETS_PATH = Path(__file__).parent.parent / "secret.json"
 SECRETS = communication.read_json(SECRETS_PATH)
 APP_DATA_PATH = Path(__file__).parent.parent / "app_data.json"
-EVENT_RECORDS_PATH = Path(__file__).parent.parent.parent / "data" / "events.csv"
+DATA_DIR = Path(__file__).parent.parent.parent / "data"
+# One of "csv", "sqlite" or "partitioned"; see communication.BACKENDS
+PERSISTENCE_BACKEND = "csv"
+CSV_EVENT_RECORDS_PATH = DATA_DIR / "events.csv"
+SQLITE_EVENT_RECORDS_PATH = DATA_DIR / "events.sqlite3"
+# Directory of monthly CSV files named YYYY-MM.csv
+PARTITIONED_EVENT_RECORDS_PATH = DATA_DIR / "events"
+EVENT_RECORDS_PATH = {
+    "csv": CSV_EVENT_RECORDS_PATH,
+    "sqlite": SQLITE_EVENT_RECORDS_PATH,
+    "partitioned": PARTITIONED_EVENT_RECORDS_PATH,
+}[PERSISTENCE_BACKEND]
+
+# Buffered CSV writes, see communication.writer: fsync "always", once per "batch",
+# or leave it to the "os"
+WRITE_FSYNC_POLICY = "batch"
+WRITE_MAX_BATCH_ROWS = 256
+WRITE_MAX_BATCH_DELAY = 0.0
+# Seconds a writer waits for rows before its thread ends and its file is closed
+WRITE_IDLE_TIMEOUT = 30.0
+# Build model tables from NumPy arrays ("numpy") instead of row dicts ("python");
+# falls back to "python" when NumPy is not installed or the backend is not "csv"
+QUERY_ENGINE = "python"
+# Estimated tokens a table may use before rows are collapsed into groups with
+# summed quantities and durations; None never collapses. TaPas reads 512 tokens,
+# including the question.
+MODEL_TABLE_TOKEN_BUDGET = 400
+# Sum queries on tables still over the budget are split into chunks that are sent
+# to the model in parallel, at most this many calls at once; None sends the table
+# in one call
+MODEL_MAX_PARALLEL_CALLS = 4
+# Seconds to wait for a connection to the model API, and then for its answer
+MODEL_CONNECT_TIMEOUT = 3.05
+MODEL_READ_TIMEOUT = 120.0
+# The model is no longer asked after this many failed or slow calls in a row,
+# until one probe call succeeds; a probe is made every reset timeout seconds
+MODEL_BREAKER_FAILURES = 5
+MODEL_BREAKER_SLOW_CALL = 30.0
+MODEL_BREAKER_RESET_TIMEOUT = 30.0
+# Model calls one process makes at once from request threads, and seconds a call
+# waits for a free slot before the user is told the model is busy
+MODEL_BULKHEAD_SIZE = 8
+MODEL_BULKHEAD_MAX_WAIT = 1.0
+# Model calls allowed per second by the inference quota, and how many may go at
+# once after a quiet spell; calls over the rate queue for a token, at most this
+# many and for at most this many seconds, before the user is asked to try again
+MODEL_CALLS_PER_SECOND = 2.0
+MODEL_CALL_BURST = 10
+MODEL_CALL_QUEUE_SIZE = 32
+MODEL_CALL_MAX_QUEUE_WAIT = 5.0
+# Model calls in flight at once when many queries are answered together, see
+# answer_queries; each takes a worker thread and one of the session's
+# communication.network.POOL_MAXSIZE kept-alive connections
+MODEL_MAX_CONCURRENT_CALLS = 16
+# While the model is loading, calls are retried after waits that double from the
+# initial delay up to the max delay, randomly shortened by up to the jitter
+# fraction; after the deadline in seconds users are told it is still warming up
+MODEL_RETRY_INITIAL_DELAY = 1.0
+MODEL_RETRY_MAX_DELAY = 10.0
+MODEL_RETRY_JITTER = 0.5
+MODEL_RETRY_DEADLINE = 25.0
+# Model answers kept for repeated questions over unchanged data: how many in
+# memory, for how many seconds, and where on disk (None keeps them in memory only)
+RESPONSE_CACHE_SIZE = 256
+RESPONSE_CACHE_TTL = 24 * 60 * 60
+RESPONSE_CACHE_DIR = DATA_DIR / "response_cache"
+# Queries are answered on this many background threads while the page polls for
+# the answer; None answers them within the request. Jobs live in the memory of
+# the process that accepted them, so only use this with a single server process.
+QUERY_JOB_WORKERS = None
+# Answers of finished query jobs kept for polling
+QUERY_JOB_HISTORY = 1024
+# Unfinished query jobs at most; further queries are turned away until some finish
+QUERY_JOB_QUEUE_SIZE = 64
+# Model-ready tables kept in memory per query, until new events arrive
+TABLE_CACHE_SIZE = 64
 MOCK_DATA_DIR = Path(__file__).parent.parent / "tests" / "test_data"
 MOCK_DATA_ONELINE = MOCK_DATA_DIR / "oneline_mock_data.csv"
 MOCK_DATA_SMALL = MOCK_DATA_DIR / "small_mock_data.csv"
@@ -1,5 +1,5 @@
 from pathlib import Path
-from speak_to_data import application, communication
+from speak_to_data import application
 
 
 def event_recorder(
@@ -7,7 +7,7 @@ def event_recorder(
     persistence_path: Path = application.config.EVENT_RECORDS_PATH,
 ):
     try:
-        communication.persist_event(
+        application.persistence_backend().persist_event(
             event_data, persistence_path, application.config.FIELD_NAMES
         )
         return ""
@@ -0,0 +1,65 @@
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, NamedTuple, Optional
+
+
+class JobStatus(NamedTuple):
+    # "pending", "done" or "failed"
+    state: str
+    result: Optional[str] = None
+
+
+class JobQueue:
+    """Runs slow work on background threads and keeps its results by job id
+
+    At most max_workers jobs run at once; the rest wait their turn, up to
+    max_pending unfinished jobs in all. Finished jobs are forgotten oldest first
+    once more than max_jobs are kept. Jobs live in the memory of this process
+    only.
+    """
+
+    def __init__(self, max_workers: int, max_jobs: int, max_pending: int) -> None:
+        self.max_jobs = max_jobs
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="query-job"
+        )
+        self._jobs: OrderedDict[str, Future] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, function: Callable[..., str], *args) -> Optional[str]:
+        """Start function(*args) in the background and return its job id
+
+        Returns None without starting it when max_pending jobs are unfinished.
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            # Unfinished jobs are never forgotten, so all of them are here
+            pending = sum(not future.done() for future in self._jobs.values())
+            if pending >= self.max_pending:
+                return None
+            self._jobs[job_id] = self._executor.submit(function, *args)
+            self._forget_finished()
+        return job_id
+
+    def status(self, job_id: str) -> Optional[JobStatus]:
+        """How the job is getting on, or None for an unknown or forgotten job"""
+        with self._lock:
+            future = self._jobs.get(job_id)
+        if future is None:
+            return None
+        if not future.done():
+            return JobStatus("pending")
+        if future.exception() is not None:
+            return JobStatus("failed")
+        return JobStatus("done", future.result())
+
+    def _forget_finished(self) -> None:
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, future in self._jobs.items() if future.done()]
+        for job_id in finished[:excess]:
+            del self._jobs[job_id]
@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from speak_to_data.application import aggregates, table_budget
+
+
+def split_table(table: dict[str, list], budget: int) -> list[dict[str, list]]:
+    """Consecutive row chunks of a table that each fit the token budget
+
+    A single row over the budget still gets a chunk of its own.
+    """
+    names = list(table)
+    header_tokens = table_budget.estimate_tokens({name: [] for name in names})
+    chunks: list[dict[str, list]] = []
+    rows: list[tuple] = []
+    tokens = header_tokens
+    for row in zip(*table.values()):
+        row_tokens = sum(map(table_budget.cell_tokens, row))
+        if rows and tokens + row_tokens > budget:
+            chunks.append(dict(zip(names, map(list, zip(*rows)))))
+            rows, tokens = [], header_tokens
+        rows.append(row)
+        tokens += row_tokens
+    if rows:
+        chunks.append(dict(zip(names, map(list, zip(*rows)))))
+    return chunks
+
+
+def combine_answers(answers: list[dict], chunks: list[dict[str, list]]) -> dict:
+    """One answer for the whole table from the answers for each chunk
+
+    Cells and coordinates of every chunk are merged, with the coordinates moved
+    to the chunk's rows in the whole table. Counts are added up, and the cells
+    of sums are added up per unit when all of them are measurements; otherwise
+    the answer lists the cells the way TaPas does. The first error, if any
+    chunk failed, is returned as is.
+    """
+    for answer in answers:
+        if "error" in answer:
+            return answer
+    cells: list[str] = []
+    coordinates: list[list[int]] = []
+    offset = 0
+    for answer, chunk in zip(answers, chunks):
+        cells.extend(answer.get("cells", []))
+        coordinates.extend(
+            [row + offset, column] for row, column in answer.get("coordinates", [])
+        )
+        offset += len(next(iter(chunk.values()), []))
+    aggregators = {answer.get("aggregator", "NONE") for answer in answers}
+    aggregator = aggregators.pop() if len(aggregators) == 1 else "NONE"
+
+    if aggregator == "COUNT":
+        text = str(sum(len(answer.get("cells", [])) for answer in answers))
+    else:
+        measurements = [aggregates.parse_measurement(cell) for cell in cells]
+        if aggregator == "SUM" and all(measurements):
+            totals = aggregates.sum_measurements(
+                [measurement for measurement in measurements if measurement]
+            )
+            text = ", ".join(str(total) for total in totals)
+        else:
+            text = f"{aggregator} > {', '.join(cells)}"
+    return {
+        "answer": text,
+        "coordinates": coordinates,
+        "cells": cells,
+        "aggregator": aggregator,
+    }
+
+
+def call_in_chunks(
+    request_object: dict,
+    call_model: Callable[[dict], dict],
+    budget: int,
+    max_workers: int,
+) -> dict:
+    """Ask the model about each chunk of an oversized table in parallel
+
+    Only sum queries are split, since their answer can be put back together
+    from the answers for the chunks; a table that fits the budget and any
+    other query go to the model in one call. At most max_workers calls run at
+    once.
+    """
+    query = request_object["inputs"]["query"]
+    table = request_object["inputs"]["table"]
+    if (
+        query not in aggregates.SUM_COLUMNS
+        or table_budget.estimate_tokens(table) <= budget
+    ):
+        return call_model(request_object)
+    chunks = split_table(table, budget)
+    chunk_requests = [
+        {**request_object, "inputs": {"query": query, "table": chunk}}
+        for chunk in chunks
+    ]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        answers = list(executor.map(call_model, chunk_requests))
+    return combine_answers(answers, chunks)
@@ -1,35 +1,122 @@
-def generate_model_ready_dataset(
-    dataset: list[dict], query_data
-) -> dict[str, list[str]]:
-    if not query_data or not query_data.columns:
-        return dict()
+import functools
+import itertools
+import operator
+from typing import Any, Callable, Iterator, Mapping, NamedTuple, Sequence
+
+from speak_to_data import communication
 
-    crops: set[str] = query_data.crops
-    actions: set[str] = query_data.actions
-    locations: set[str] = query_data.locations
+
+def event_filter(query_data) -> communication.EventFilter:
+    """Constraints from a query that a persistence backend can apply while reading"""
     start_date, end_date = query_data.parsed_date.date_range
+    return communication.EventFilter(
+        crops=query_data.crops,
+        actions=query_data.actions,
+        locations=query_data.locations,
+        start_date=start_date,
+        end_date=end_date,
+    )
+
+
+# Rows sampled to estimate how many rows each check lets through
+SELECTIVITY_SAMPLE_SIZE = 256
+
 
-    filtered = dataset
+class RowCheck(NamedTuple):
+    key: str
+    test: Callable[[Any], bool]
 
-    if crops:
-        filtered = [row for row in filtered if row["crop"] in crops]
-    if actions:
-        filtered = [row for row in filtered if row["action"] in actions]
-    if locations:
-        filtered = [row for row in filtered if row["location"] in locations]
+
+def compile_checks(query_data, dataset: Sequence[Mapping]) -> list[RowCheck]:
+    """The query constraints as per-field checks, most selective first
+
+    Each check's pass rate is measured on an evenly spaced sample of the dataset,
+    so the check that rejects the most rows runs first and the others only see
+    the rows it lets through.
+    """
+    checks = [
+        RowCheck(key, values.__contains__)
+        for key, values in (
+            ("crop", query_data.crops),
+            ("action", query_data.actions),
+            ("location", query_data.locations),
+        )
+        if values
+    ]
+    start_date, end_date = query_data.parsed_date.date_range
     if start_date and end_date:
-        filtered = [row for row in filtered if start_date <= row["date"] <= end_date]
+        checks.append(RowCheck("date", functools.partial(operator.le, start_date)))
+        checks.append(RowCheck("date", functools.partial(operator.ge, end_date)))
+    step = max(1, len(dataset) // SELECTIVITY_SAMPLE_SIZE)
+    sample = dataset[::step]
+
+    def pass_rate(check: RowCheck) -> int:
+        return sum(map(check.test, map(operator.itemgetter(check.key), sample)))
+
+    return sorted(checks, key=pass_rate)
+
 
-    if not filtered:
+def _matching_rows(dataset: Sequence[Mapping], checks: list[RowCheck]) -> Iterator:
+    """Lazily chain the checks so every row goes through them in one pass
+
+    Each check is a compress() over the rows that passed the previous one, with
+    its field lookups and comparisons done by C-level callables. The first check
+    reads the dataset directly; later ones only see the rows that got through.
+    """
+    if not checks:
+        return iter(dataset)
+    key, test = checks[0]
+    rows: Iterator = itertools.compress(
+        dataset, map(test, map(operator.itemgetter(key), dataset))
+    )
+    for key, test in checks[1:]:
+        rows, fields = itertools.tee(rows)
+        rows = itertools.compress(
+            rows, map(test, map(operator.itemgetter(key), fields))
+        )
+    return rows
+
+
+def generate_model_ready_dataset(
+    dataset: Sequence[Mapping], query_data
+) -> dict[str, list[str]]:
+    """The matching rows of the queried columns, as one list of values per column
+
+    Filtering, projection and the transpose into columns happen in a single pass
+    over the dataset, without building a dict per matching row.
+    """
+    if not query_data or not query_data.columns or not dataset:
         return dict()
 
-    filter_columns = [
-        {key: row[key] for key in row.keys() if key in query_data.columns}
-        for row in filtered
-    ]
+    keys = [key for key in dataset[0].keys() if key in query_data.columns]
+    if not keys:
+        return dict()
+    rows = _matching_rows(dataset, compile_checks(query_data, dataset))
 
-    transform = _list_of_dicts_to_one_dict(filter_columns)
-    return transform
+    if len(keys) == 1:
+        values = list(map(operator.itemgetter(keys[0]), rows))
+        return {keys[0]: values} if values else dict()
+    columns = list(zip(*map(operator.itemgetter(*keys), rows)))
+    return {key: list(column) for key, column in zip(keys, columns)}
+
+
+def generate_vectorised_dataset(
+    event_columns: communication.event_store.EventColumns, query_data
+) -> dict[str, list[str]]:
+    """Same table as generate_model_ready_dataset, filtered with NumPy masks
+
+    Reads the encoded columns of the event store directly instead of a list of
+    row dicts. Needs communication.vectorised.AVAILABLE.
+    """
+    if not query_data or not query_data.columns or not event_columns.row_count:
+        return dict()
+
+    keys = [key for key in event_columns.columns if key in query_data.columns]
+    table = communication.vectorised.VectorisedColumns.from_columns(event_columns)
+    rows = table.select(event_filter(query_data))
+    if not keys or not len(rows):
+        return dict()
+    return {key: table.decode(key, rows) for key in keys}
 
 
 def _list_of_dicts_to_one_dict(dataset: list[dict[str, str]]) -> dict[str, list[str]]:
@@ -4,6 +4,10 @@ import re
 from spacy.tokens.doc import Doc
 from speak_to_data import application
 
+# Questions asked of the model for "how much <crop>" and maintenance queries
+QUANTITY_SUM_CRUX = "what is the sum of all quantities?"
+DURATION_SUM_CRUX = "what is sum of duration?"
+
 
 class QueryData:
     def __init__(self, raw_query: str) -> None:
@@ -49,12 +53,12 @@ class QueryData:
             and self.docd_query[2].lemma_ in application.config.CROPS
         ):
             self.columns.add("quantity")
-            crux = "what is the sum of all quantities?"
+            crux = QUANTITY_SUM_CRUX
         elif "maintenance" in set(
             token.lemma_ for token in self.docd_query
         ) or "maintain" in set(token.lemma_ for token in self.docd_query):
             self.columns.add("duration")
-            crux = "what is sum of duration?"
+            crux = DURATION_SUM_CRUX
         return crux
 
     @staticmethod
@@ -29,6 +29,6 @@ class Response:
             elif self.query_empty:
                 return "Something went wrong parsing your query. Please attempt to reword it."
             else:
-                return self.model_response["answer"]
+                return self.model_response["error"]
         else:
             return self.model_response["answer"]
@@ -0,0 +1,89 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from speak_to_data.application import response_parser
+
+WARMING_UP_ERROR = "The model is still warming up. Please ask again in a minute or two."
+
+
+class RetryPolicy(NamedTuple):
+    """How long to keep asking a model that is still loading
+
+    Waits grow exponentially from initial_delay up to max_delay, each shortened by
+    a random fraction of up to jitter so that retries from several requests
+    spread out. A wait is never shorter than the estimated_time the loading
+    error carries, and no retry is made that would end after deadline seconds.
+    """
+
+    initial_delay: float = 1.0
+    multiplier: float = 2.0
+    max_delay: float = 10.0
+    jitter: float = 0.5
+    deadline: float = 25.0
+
+    def delay(
+        self,
+        attempt: int,
+        estimated_time: Optional[float] = None,
+        rng: Callable[[], float] = random.random,
+    ) -> float:
+        """Seconds to wait before retry number attempt, counting from 0"""
+        backoff = min(self.max_delay, self.initial_delay * self.multiplier**attempt)
+        backoff *= 1 - self.jitter * rng()
+        return max(backoff, estimated_time or 0.0)
+
+
+def _warming_up(model_response: dict) -> dict:
+    return {
+        "error": WARMING_UP_ERROR,
+        "estimated_time": model_response.get("estimated_time"),
+    }
+
+
+def call_with_retries(
+    call_model: Callable[[dict], dict],
+    request_object: dict,
+    policy: RetryPolicy,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], None] = time.sleep,
+) -> dict:
+    """Call the model until it stops loading or the policy's deadline is near
+
+    Returns the first answer or error that isn't about loading. If the next wait
+    would run past the deadline, returns a warming-up error straight away, so a
+    cold model holds a worker for at most the deadline.
+    """
+    give_up_at = clock() + policy.deadline
+    attempt = 0
+    while True:
+        model_response = call_model(request_object)
+        if not response_parser.Response(model_response).is_loading:
+            return model_response
+        delay = policy.delay(attempt, model_response.get("estimated_time"))
+        if clock() + delay > give_up_at:
+            return _warming_up(model_response)
+        sleep(delay)
+        attempt += 1
+
+
+async def call_with_retries_async(
+    call_model: Callable[[dict], Awaitable[dict]],
+    request_object: dict,
+    policy: RetryPolicy,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+) -> dict:
+    """call_with_retries for a coroutine calling the model"""
+    give_up_at = clock() + policy.deadline
+    attempt = 0
+    while True:
+        model_response = await call_model(request_object)
+        if not response_parser.Response(model_response).is_loading:
+            return model_response
+        delay = policy.delay(attempt, model_response.get("estimated_time"))
+        if clock() + delay > give_up_at:
+            return _warming_up(model_response)
+        await sleep(delay)
+        attempt += 1
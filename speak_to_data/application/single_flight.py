@@ -0,0 +1,55 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Runs a call once for all callers asking for the same key at the same time
+
+    The first caller for a key makes the call; callers arriving before it
+    finishes wait and get its result, or its exception. Once the call is done
+    the key is forgotten, so later callers make a fresh call. Threads use do,
+    coroutines do_async; the two don't share calls.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[str, Future] = dict()
+        self._async_calls: dict[str, asyncio.Future] = dict()
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key: str, call: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if future is None:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = call()
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def do_async(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        """do for coroutines; cancelling one caller leaves the call to the others"""
+        future = self._async_calls.get(key)
+        if future is None:
+            future = self._async_calls[key] = asyncio.ensure_future(call())
+            future.add_done_callback(lambda done: self._async_calls.pop(key))
+        else:
+            with self._lock:
+                self.shared += 1
+        return await asyncio.shield(future)
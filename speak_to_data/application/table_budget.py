@@ -0,0 +1,72 @@
+import re
+from typing import Optional
+
+from speak_to_data.application import aggregates
+
+# Columns whose values are added up when rows are collapsed
+SUMMED_COLUMNS = ("quantity", "duration")
+# Roughly how the model's tokenizer splits cells: runs of digits, runs of letters
+# and single punctuation marks
+_TOKEN = re.compile(r"\d+|[^\W\d_]+|[^\w\s]")
+
+
+def cell_tokens(value) -> int:
+    """Approximate number of tokens the model needs for one cell"""
+    return len(_TOKEN.findall(str(value))) or 1
+
+
+def estimate_tokens(table: dict[str, list]) -> int:
+    """Approximate number of tokens the model needs for a table"""
+    tokens = 0
+    for name, values in table.items():
+        tokens += len(_TOKEN.findall(name))
+        tokens += sum(map(cell_tokens, values))
+    return tokens
+
+
+def _group_key(name: str, value) -> object:
+    """What rows must share in a column to be collapsed into one row"""
+    if name == "date":
+        return str(value)[:7]
+    if name in SUMMED_COLUMNS:
+        measurement = aggregates.parse_measurement(str(value))
+        # Values without a number can't be added up, so only equal ones collapse
+        return measurement.unit if measurement else ("", str(value))
+    return value
+
+
+def group_rows(table: dict[str, list]) -> dict[str, list]:
+    """Collapse rows that agree on every column but the summed ones
+
+    Dates are grouped by month. Quantities and durations are summed per group
+    and unit, so a sum over the collapsed table equals the sum over the original.
+    Groups keep the order of their first row.
+    """
+    names = list(table)
+    groups: dict[tuple, list[list]] = dict()
+    for row in zip(*table.values()):
+        key = tuple(_group_key(name, value) for name, value in zip(names, row))
+        groups.setdefault(key, []).append(list(row))
+
+    grouped: dict[str, list] = {name: [] for name in names}
+    for key, rows in groups.items():
+        for column, name in enumerate(names):
+            values = [row[column] for row in rows]
+            if name == "date":
+                value = key[column]
+            elif name in SUMMED_COLUMNS and not isinstance(key[column], tuple):
+                parsed = map(aggregates.parse_measurement, values)
+                measurements = [measurement for measurement in parsed if measurement]
+                (total,) = aggregates.sum_measurements(measurements)
+                value = str(total)
+            else:
+                value = values[0]
+            grouped[name].append(value)
+    return grouped
+
+
+def fit_to_budget(table: dict[str, list], budget: Optional[int]) -> dict[str, list]:
+    """The table as is if it fits the token budget, collapsed by group if not"""
+    if budget is None or estimate_tokens(table) <= budget:
+        return table
+    return group_rows(table)
@@ -0,0 +1,123 @@
+"""Compare the single-pass table builder with the multi-pass one it replaced
+
+Run with: python -m speak_to_data.benchmarks.bench_prepare_for_model
+"""
+
+import datetime
+import random
+import timeit
+from typing import NamedTuple
+
+from speak_to_data.application import config, prepare_for_model
+
+SIZES = (10_000, 100_000, 1_000_000)
+REPEATS = 5
+
+
+class ParsedDate(NamedTuple):
+    date_range: tuple[datetime.date, datetime.date]
+
+
+class BenchmarkQuery(NamedTuple):
+    """The attributes of QueryData that the table builder reads"""
+
+    columns: set[str]
+    crops: set[str]
+    actions: set[str]
+    locations: set[str]
+    parsed_date: ParsedDate
+
+
+QUERIES = {
+    # One crop and one action: a small fraction of the rows match
+    "narrow": BenchmarkQuery(
+        columns={"crop", "action", "quantity"},
+        crops={"cress"},
+        actions={"harvest"},
+        locations=set(),
+        parsed_date=ParsedDate(
+            (datetime.date(2023, 1, 1), datetime.date(2023, 12, 31))
+        ),
+    ),
+    # One year of everything: a quarter of the rows match
+    "broad": BenchmarkQuery(
+        columns={"action", "duration"},
+        crops=set(),
+        actions=set(),
+        locations=set(),
+        parsed_date=ParsedDate(
+            (datetime.date(2023, 1, 1), datetime.date(2023, 12, 31))
+        ),
+    ),
+}
+
+
+def generate_dataset(size: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    actions, crops = sorted(config.ACTIONS), sorted(config.CROPS)
+    locations = sorted(config.LOCATIONS)
+    first_day = datetime.date(2020, 1, 1)
+    return [
+        {
+            "date": first_day + datetime.timedelta(days=rng.randrange(4 * 365)),
+            "action": rng.choice(actions),
+            "crop": rng.choice(crops),
+            "quantity": f"{rng.randrange(1, 1000)}gr",
+            "duration": str(rng.randrange(0, 120)),
+            "location": rng.choice(locations),
+            "location_type": "hoop-house-raised-bed",
+        }
+        for _ in range(size)
+    ]
+
+
+def multi_pass_dataset(dataset: list[dict], query_data) -> dict[str, list[str]]:
+    """generate_model_ready_dataset as it was before the single-pass rewrite"""
+    if not query_data or not query_data.columns:
+        return dict()
+    start_date, end_date = query_data.parsed_date.date_range
+    filtered = dataset
+    if query_data.crops:
+        filtered = [row for row in filtered if row["crop"] in query_data.crops]
+    if query_data.actions:
+        filtered = [row for row in filtered if row["action"] in query_data.actions]
+    if query_data.locations:
+        filtered = [row for row in filtered if row["location"] in query_data.locations]
+    if start_date and end_date:
+        filtered = [row for row in filtered if start_date <= row["date"] <= end_date]
+    if not filtered:
+        return dict()
+    filter_columns = [
+        {key: row[key] for key in row.keys() if key in query_data.columns}
+        for row in filtered
+    ]
+    return prepare_for_model._list_of_dicts_to_one_dict(filter_columns)
+
+
+def _best_time(function, *args) -> float:
+    return min(timeit.repeat(lambda: function(*args), number=1, repeat=REPEATS))
+
+
+def main() -> None:
+    print(
+        f"{'query':>6} {'rows':>10} {'multi-pass':>12} {'single-pass':>12} {'speedup':>8}"
+    )
+    for size in SIZES:
+        dataset = generate_dataset(size)
+        for name, query in QUERIES.items():
+            expected = multi_pass_dataset(dataset, query)
+            actual = prepare_for_model.generate_model_ready_dataset(dataset, query)
+            if actual != expected:
+                raise AssertionError(f"Tables differ for {name} at {size} rows")
+            before = _best_time(multi_pass_dataset, dataset, query)
+            after = _best_time(
+                prepare_for_model.generate_model_ready_dataset, dataset, query
+            )
+            print(
+                f"{name:>6} {size:>10} {before * 1000:>10.1f}ms "
+                f"{after * 1000:>10.1f}ms {before / after:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Latency of model calls with a new connection per call and with the shared session
+
+Runs against a local stand-in for the model API, so it measures the cost of the
+connection handling rather than of the model. Without TLS it leaves out the
+handshake, which is most of the saving against the real API.
+
+Run with: python -m speak_to_data.benchmarks.bench_tapas_interface
+"""
+
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from speak_to_data.communication import network
+
+CALLS = 1000
+PAYLOAD = {
+    "inputs": {
+        "query": "what is the sum of all quantities?",
+        "table": {"crop": ["cress", "cress"], "quantity": ["1sqft", "2sqft"]},
+    },
+    "options": {"wait_for_model": "True", "use_cache": "False"},
+}
+ANSWER = json.dumps(
+    {"answer": "SUM > 1sqft, 2sqft", "cells": ["1sqft", "2sqft"], "aggregator": "SUM"}
+).encode()
+
+
+class StandInModel(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Like production servers; otherwise keep-alive responses wait on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(ANSWER)))
+        self.end_headers()
+        self.wfile.write(ANSWER)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def _percentiles(latencies: list[float]) -> tuple[float, float]:
+    cut_points = statistics.quantiles(latencies, n=100)
+    return cut_points[49], cut_points[98]
+
+
+def _time_calls(call) -> list[float]:
+    latencies = []
+    for _ in range(CALLS):
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main() -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInModel)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/model"
+    headers = {"Authorization": "Bearer stand-in"}
+    # Its own breaker and no rate limit, so only the connection handling is timed
+    tapas_interface = network.TapasInterface(
+        "stand-in",
+        full_url=url,
+        breaker=network.CircuitBreaker(),
+        rate_limiter=network.RateLimiter(1e6, 1_000_000, 0, 0.0),
+    )
+
+    results = {
+        "requests.post per call": _time_calls(
+            lambda: requests.post(url, headers=headers, json=PAYLOAD).json()
+        ),
+        "shared session": _time_calls(lambda: tapas_interface.call_model_api(PAYLOAD)),
+    }
+    server.shutdown()
+
+    print(f"{'':<24} {'p50':>8} {'p99':>8}")
+    for name, latencies in results.items():
+        p50, p99 = _percentiles(latencies)
+        print(f"{name:<24} {p50 * 1000:>6.2f}ms {p99 * 1000:>6.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,38 @@
-from speak_to_data.communication import network, persistence
+from speak_to_data.communication import (
+    async_network,
+    event_store,
+    filters,
+    indexes,
+    locking,
+    network,
+    partitions,
+    persistence,
+    response_cache,
+    snapshot,
+    sqlite_store,
+    vectorised,
+    writer,
+)
 
 persist_event = persistence.persist_event
 read_dataset = persistence.read_dataset
+read_columns = persistence.read_columns
+iter_dataset = persistence.iter_dataset
 read_json = persistence.read_json
+EventFilter = filters.EventFilter
+
+# Modules providing initialise_store, persist_event, read_dataset and
+# data_generation, all but the first two taking an optional EventFilter, and
+# compact where the storage format supports it
+BACKENDS = {
+    "csv": persistence,
+    "sqlite": sqlite_store,
+    "partitioned": partitions,
+}
+
+EventStore = event_store.EventStore
+get_event_store = event_store.get_event_store
 
 TapasInterface = network.TapasInterface
+AsyncTapasInterface = async_network.AsyncTapasInterface
+ResponseCache = response_cache.ResponseCache
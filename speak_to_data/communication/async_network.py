@@ -0,0 +1,100 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+
+from speak_to_data.communication import network
+
+
+class AsyncTapasInterface:
+    """TapasInterface for asyncio, so one thread can have many model calls in flight
+
+    Calls are sent through TapasInterface's pooled session on worker threads, so
+    they reuse its kept-alive connections and its timeout. At most
+    max_concurrency calls are in flight at once; the others wait for a free slot
+    before their timeout starts. Calls share TapasInterface's rate limiter and
+    circuit breaker; the concurrency limit stands in for its bulkhead. Close the
+    interface when done with it to let its worker threads go.
+    """
+
+    def __init__(
+        self,
+        api_token: str,
+        timeout: network.Timeout = network.DEFAULT_TIMEOUT,
+        max_concurrency: int = network.POOL_MAXSIZE,
+        full_url: Optional[str] = None,
+        breaker: Optional[network.CircuitBreaker] = None,
+        rate_limiter: Optional[network.RateLimiter] = None,
+    ):
+        self.api_token = api_token
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.full_url = full_url or "/".join(network.TapasInterface.tapas_large)
+        self.session = network.shared_session()
+        self.breaker = breaker or network.shared_breaker()
+        self.rate_limiter = rate_limiter or network.shared_rate_limiter()
+        # Made on first use, inside the event loop that waits on it
+        self._slots: Optional[asyncio.Semaphore] = None
+        # One worker per slot, so a call holding a slot is sent straight away
+        self._workers = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="model-call"
+        )
+
+    def close(self) -> None:
+        """Let the worker threads go once the calls in flight are done"""
+        self._workers.shutdown(wait=False)
+
+    async def call_model_api(self, payload: dict) -> dict:
+        if not self.breaker.allow():
+            return {"error": network.CIRCUIT_OPEN_ERROR}
+        wait = self.rate_limiter.reserve()
+        if wait is None:
+            self.breaker.cancel()
+            return {"error": network.RATE_LIMITED_ERROR}
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        try:
+            if wait > 0:
+                try:
+                    await asyncio.sleep(wait)
+                finally:
+                    self.rate_limiter.done_waiting(wait)
+            await self._slots.acquire()
+        except BaseException:
+            # Cancelled before the call was sent
+            self.rate_limiter.refund()
+            self.breaker.cancel()
+            raise
+        try:
+            return await self._send(payload)
+        finally:
+            self._slots.release()
+
+    async def _send(self, payload: dict) -> dict:
+        started = time.monotonic()
+        try:
+            model_response = await asyncio.get_running_loop().run_in_executor(
+                self._workers,
+                network.post_payload,
+                self.session,
+                self.full_url,
+                self.api_token,
+                payload,
+                self.timeout,
+            )
+        except requests.Timeout:
+            self.breaker.record(False)
+            return {"error": network.TIMEOUT_ERROR}
+        except requests.RequestException:
+            self.breaker.record(False)
+            return {"error": network.UNREACHABLE_ERROR}
+        except BaseException:
+            self.breaker.record(False)
+            raise
+        self.breaker.record(
+            not network.is_upstream_failure(model_response),
+            time.monotonic() - started,
+        )
+        return model_response
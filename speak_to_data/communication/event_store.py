@@ -0,0 +1,526 @@
+import csv
+import datetime
+import functools
+import io
+import os
+import threading
+from array import array
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+)
+
+from speak_to_data.communication import locking, snapshot
+from speak_to_data.communication.filters import EventFilter
+from speak_to_data.communication.indexes import DateIndex, PostingIndex
+
+# Bytes just before the last parsed offset that must be unchanged for the file to
+# count as "appended to" rather than rewritten
+TAIL_FINGERPRINT_SIZE = 64
+
+DATE_COLUMN = "date"
+# Columns with a small, known set of values, stored as 16 bit codes
+CATEGORICAL_COLUMNS = ("action", "crop", "location", "location_type")
+# Keys in app_data.json that hold the known values of each categorical column
+APP_DATA_CATEGORIES = {
+    "actions": "action",
+    "crops": "crop",
+    "locations": "location",
+    "location-types": "location_type",
+}
+
+
+class Vocabulary:
+    """Two-way mapping between the values of each column and small integer codes
+
+    Code 0 is always the empty string. Values are only ever added, so a code
+    handed out once stays valid for the lifetime of the vocabulary.
+    """
+
+    def __init__(self, values: Optional[dict[str, list[str]]] = None) -> None:
+        self._values: dict[str, list[str]] = dict()
+        self._codes: dict[str, dict[str, int]] = dict()
+        for column, column_values in (values or dict()).items():
+            for value in column_values:
+                self.encode(column, value)
+
+    @classmethod
+    def from_app_data(cls, app_data: dict) -> "Vocabulary":
+        return cls(
+            {
+                column: list(app_data.get(category, ()))
+                for category, column in APP_DATA_CATEGORIES.items()
+            }
+        )
+
+    def copy(self) -> "Vocabulary":
+        return Vocabulary(self._values)
+
+    def as_dict(self) -> dict[str, list[str]]:
+        return {column: list(values) for column, values in self._values.items()}
+
+    def encode(self, column: str, value: Optional[str]) -> int:
+        codes = self._codes.get(column)
+        if codes is None:
+            codes = self._codes[column] = {"": 0}
+            self._values[column] = [""]
+        # A row that is missing trailing fields has None in them; store as empty
+        value = value or ""
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self._values[column].append(value)
+        return code
+
+    def values(self, column: str) -> list[str]:
+        """Value for each code, indexable by code; treat as read-only"""
+        return self._values.get(column, [""])
+
+    def code(self, column: str, value: str) -> Optional[int]:
+        """Code of a value, or None if it never occurred in the column"""
+        return self._codes.get(column, dict()).get(value)
+
+
+_shared_vocabulary = Vocabulary()
+
+
+def seed_vocabulary(app_data: dict) -> None:
+    """Pre-assign codes to the values in app_data.json for stores created later"""
+    global _shared_vocabulary
+    _shared_vocabulary = Vocabulary.from_app_data(app_data)
+
+
+def _new_column(name: str) -> array:
+    if name == DATE_COLUMN:
+        return array("i")
+    if name in CATEGORICAL_COLUMNS:
+        return array("H")
+    return array("I")
+
+
+_dates: dict[int, datetime.date] = dict()
+
+
+def _date(ordinal: int) -> datetime.date:
+    """Shared date objects, since many events fall on the same day"""
+    date = _dates.get(ordinal)
+    if date is None:
+        date = _dates[ordinal] = datetime.date.fromordinal(ordinal)
+    return date
+
+
+class EventColumns(NamedTuple):
+    """Dictionary-encoded columns of the first row_count events
+
+    Dates are stored as proleptic Gregorian ordinals, every other column as codes
+    into the vocabulary. The arrays may already hold rows past row_count that are
+    still being added; those are ignored. The posting and date indexes, if there
+    are any, answer value and date range lookups on the same columns. Other
+    modules keep what they build from the columns in derived, such as the NumPy
+    arrays of communication.vectorised; like the indexes, it is kept while rows
+    are appended and starts empty when the file is parsed again.
+    """
+
+    columns: dict[str, array]
+    vocabulary: Vocabulary
+    row_count: int
+    postings: Optional[PostingIndex] = None
+    date_index: Optional[DateIndex] = None
+    derived: Optional[dict[str, Any]] = None
+
+    def decode(self, name: str) -> list:
+        column = self.columns[name][: self.row_count]
+        if name == DATE_COLUMN:
+            return [_date(ordinal) for ordinal in column]
+        values = self.vocabulary.values(name)
+        return [values[code] for code in column]
+
+    def row(self, index: int) -> "EventRow":
+        if not 0 <= index < self.row_count:
+            raise IndexError(index)
+        return EventRow(self, index)
+
+    def row_views(self) -> list["EventRow"]:
+        return [EventRow(self, index) for index in range(self.row_count)]
+
+    def select(self, event_filter: Optional[EventFilter]) -> Iterator[int]:
+        """Indexes of the rows that match the filter, in recorded order"""
+        return matching_rows(
+            self.columns,
+            self.vocabulary,
+            self.row_count,
+            event_filter,
+            self.postings,
+            self.date_index,
+        )
+
+    def as_dicts(self, indexes: Optional[Iterable[int]] = None) -> list[dict]:
+        """One fresh dict per event, for all rows or only the given ones"""
+        if indexes is None:
+            fieldnames = tuple(self.columns)
+            decoded = [self.decode(name) for name in fieldnames]
+            return [dict(zip(fieldnames, values)) for values in zip(*decoded)]
+        return list(decode_rows(self.columns, self.vocabulary, indexes))
+
+
+def matching_rows(
+    columns: Mapping[str, Sequence[int]],
+    vocabulary: Vocabulary,
+    row_count: int,
+    event_filter: Optional[EventFilter],
+    postings: Optional[PostingIndex] = None,
+    date_index: Optional[DateIndex] = None,
+) -> Iterator[int]:
+    """Find the rows of encoded columns that match a filter
+
+    The filter's values are translated to codes once, so checks compare small
+    integers, and the date is only looked at for rows that passed the others.
+    With a posting index, the rows holding the filtered values come from
+    intersecting their posting lists, and with a date index the rows in the date
+    range come from a binary search, so only the rows those return are looked
+    at; without either, every row is. A filter on a column the events don't have
+    matches nothing.
+    """
+    if not event_filter:
+        yield from range(row_count)
+        return
+    checks = []
+    checked_names = []
+    for name, values in (
+        ("crop", event_filter.crops),
+        ("action", event_filter.actions),
+        ("location", event_filter.locations),
+    ):
+        if values:
+            if name not in columns:
+                # No event in a file without the column can match
+                return
+            known = (vocabulary.code(name, value) for value in values)
+            codes = {code for code in known if code is not None}
+            checks.append((columns[name], codes))
+            checked_names.append(name)
+    date_range = None
+    if event_filter.start_date and event_filter.end_date:
+        if DATE_COLUMN not in columns:
+            return
+        date_range = (
+            event_filter.start_date.toordinal(),
+            event_filter.end_date.toordinal(),
+        )
+    lists = []
+    if postings is not None and checks:
+        lists = [
+            postings.rows(name, codes, row_count)
+            for name, (_, codes) in zip(checked_names, checks)
+        ]
+        checks = []
+    if date_index is not None and date_range:
+        lists.append(date_index.rows_between(*date_range, row_count))
+        date_range = None
+    candidates: Sequence[int] = range(row_count)
+    if len(lists) == 1:
+        candidates = lists[0]
+    elif lists:
+        lists.sort(key=len)
+        candidates = sorted(set(lists[0]).intersection(*lists[1:]))
+    dates = columns.get(DATE_COLUMN, ())
+    for row in candidates:
+        if not all(column[row] in codes for column, codes in checks):
+            continue
+        if date_range and not date_range[0] <= dates[row] <= date_range[1]:
+            continue
+        yield row
+
+
+def decode_rows(
+    columns: Mapping[str, Sequence[int]],
+    vocabulary: Vocabulary,
+    indexes: Iterable[int],
+) -> Iterator[dict]:
+    """Decode the given rows of encoded columns into one dict per event"""
+    decoders = [
+        (name, column, None if name == DATE_COLUMN else vocabulary.values(name))
+        for name, column in columns.items()
+    ]
+    for index in indexes:
+        yield {
+            name: _date(column[index]) if values is None else values[column[index]]
+            for name, column, values in decoders
+        }
+
+
+class EventRow:
+    """Read-only view of one event that decodes fields on access"""
+
+    __slots__ = ("_columns", "_index")
+
+    def __init__(self, columns: EventColumns, index: int) -> None:
+        self._columns = columns
+        self._index = index
+
+    def __getitem__(self, name: str):
+        code = self._columns.columns[name][self._index]
+        if name == DATE_COLUMN:
+            return _date(code)
+        return self._columns.vocabulary.values(name)[code]
+
+    def keys(self):
+        return self._columns.columns.keys()
+
+    def as_dict(self) -> dict:
+        return {name: self[name] for name in self.keys()}
+
+
+class _FileSignature(NamedTuple):
+    inode: int
+    mtime_ns: int
+    size: int
+
+
+def _signature(stat: os.stat_result) -> _FileSignature:
+    return _FileSignature(stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class EventStore:
+    """Event records from one CSV file, parsed once and held in memory as columns
+
+    If a snapshot file sits next to the CSV, a full load starts from the columns
+    in the snapshot and parses the CSV as the delta recorded since it was taken,
+    skipping any bytes of it the snapshot already holds.
+
+    The store remembers how many bytes of the file it has parsed. When the file
+    grows by appends only the new bytes are parsed and added to the columns; if
+    the header or the bytes before the last offset changed, or the file shrank or
+    was replaced, the whole file is parsed again. Only complete lines are parsed,
+    so a row that is still being written is picked up on the next refresh.
+
+    Columns are only ever extended, and the row count is published after all of
+    them have been extended, so concurrent readers see whole rows only.
+
+    The generation goes up whenever the store picks up a change to the file,
+    including appends and compaction from other processes, so anything derived
+    from the events can be stamped with it and checked for staleness.
+    """
+
+    def __init__(self, persistence_path: Path) -> None:
+        self.persistence_path = persistence_path
+        self._reload_lock = threading.Lock()
+        self._signature: Optional[_FileSignature] = None
+        self._loaded = EventColumns(dict(), _shared_vocabulary.copy(), 0)
+        self._header = b""
+        self._offset = 0
+        self._tail = b""
+        self._generation = 0
+
+    @property
+    def snapshot_path(self) -> Path:
+        return snapshot.snapshot_path(self.persistence_path)
+
+    def refresh(self) -> None:
+        """Bring the columns up to date with the backing file"""
+        if _signature(os.stat(self.persistence_path)) == self._signature:
+            return
+        with self._reload_lock:
+            with locking.open_locked(
+                self.persistence_path, "rb", exclusive=False
+            ) as events_store:
+                self._catch_up(events_store)
+
+    def _catch_up(self, events_store) -> None:
+        # Another thread may have refreshed while this one was waiting
+        signature = _signature(os.fstat(events_store.fileno()))
+        if signature == self._signature:
+            return
+        if not self._read_tail(events_store, signature):
+            self._read_full(events_store)
+        self._signature = signature
+        self._generation += 1
+
+    def compact(self) -> int:
+        """Fold every event into the snapshot and truncate the CSV to its header
+
+        Runs under an exclusive lock on the CSV, which writers and readers in every
+        process respect, so no row is appended to the old CSV after it was folded
+        in. The snapshot records which bytes of the CSV it holds, so if truncating
+        fails or the process dies before it, readers skip those bytes rather than
+        count their events twice. Returns the number of events in the snapshot.
+        """
+        with self._reload_lock:
+            with locking.open_locked(
+                self.persistence_path, "rb", exclusive=True
+            ) as events_store:
+                self._catch_up(events_store)
+                loaded = self._loaded
+                inode = os.fstat(events_store.fileno()).st_ino
+                snapshot.write_snapshot(
+                    self.snapshot_path,
+                    snapshot.Snapshot(
+                        loaded.columns,
+                        loaded.vocabulary.as_dict(),
+                        loaded.row_count,
+                        snapshot.Source(inode, self._offset, self._tail),
+                    ),
+                )
+                self._signature = self._truncate_to_header()
+                self._generation += 1
+        return loaded.row_count
+
+    def _truncate_to_header(self) -> _FileSignature:
+        """Atomically replace the CSV with one holding just its header"""
+        temporary_path = self.persistence_path.with_name(
+            f".{self.persistence_path.name}.{os.getpid()}"
+        )
+        try:
+            with open(temporary_path, "wb") as delta:
+                delta.write(self._header)
+                delta.flush()
+                os.fsync(delta.fileno())
+                signature = _signature(os.fstat(delta.fileno()))
+            os.replace(temporary_path, self.persistence_path)
+        finally:
+            temporary_path.unlink(missing_ok=True)
+        self._offset = 0
+        self._tail = b""
+        self._advance(self._header)
+        return signature
+
+    def _read_tail(self, events_store, signature: _FileSignature) -> bool:
+        """Parse only the bytes appended since the last refresh, if that is safe
+
+        Appends always grow the file, so a changed file that didn't grow was
+        rewritten, even if its header and last bytes are the same.
+        """
+        if (
+            self._signature is None
+            or not self._header
+            or signature.inode != self._signature.inode
+            or signature.size <= self._offset
+        ):
+            return False
+        if events_store.read(len(self._header)) != self._header:
+            return False
+        events_store.seek(self._offset - len(self._tail))
+        if events_store.read(len(self._tail)) != self._tail:
+            return False
+
+        chunk = _complete_lines(events_store.read())
+        loaded = self._loaded
+        row_count = loaded.row_count
+        row_count += _parse_records(chunk, loaded.columns, loaded.vocabulary)
+        for index in (loaded.postings, loaded.date_index):
+            if index is not None:
+                index.extend(row_count)
+        self._advance(chunk)
+        self._loaded = loaded._replace(row_count=row_count)
+        return True
+
+    def _read_full(self, events_store) -> None:
+        events_store.seek(0)
+        chunk = _complete_lines(events_store.read())
+        header_end = chunk.find(b"\n") + 1
+        self._header = chunk[:header_end]
+        fieldnames = next(
+            csv.reader(io.StringIO(self._header.decode()), dialect="unix"), []
+        )
+        compacted = snapshot.read_snapshot(self.snapshot_path)
+        delta_start = header_end
+        if compacted and list(compacted.columns) == fieldnames:
+            columns = compacted.columns
+            vocabulary = Vocabulary(compacted.vocabulary)
+            row_count = compacted.row_count
+            covered = snapshot.covered_bytes(compacted.source, events_store)
+            delta_start = max(delta_start, covered)
+        else:
+            columns = {name: _new_column(name) for name in fieldnames}
+            vocabulary = _shared_vocabulary.copy()
+            row_count = 0
+        row_count += _parse_records(chunk[delta_start:], columns, vocabulary)
+        self._offset = 0
+        self._tail = b""
+        self._advance(chunk)
+        self._loaded = EventColumns(
+            columns,
+            vocabulary,
+            row_count,
+            PostingIndex(columns),
+            DateIndex(columns[DATE_COLUMN]) if DATE_COLUMN in columns else None,
+            dict(),
+        )
+
+    def _advance(self, chunk: bytes) -> None:
+        self._offset += len(chunk)
+        tail = self._tail + chunk[-TAIL_FINGERPRINT_SIZE:]
+        self._tail = tail[-TAIL_FINGERPRINT_SIZE:]
+
+    def columns(self) -> EventColumns:
+        """Up to date encoded columns; treat the arrays as read-only"""
+        self.refresh()
+        return self._loaded
+
+    def rows(self) -> list[dict]:
+        """Materialise the columns as one fresh dict per event"""
+        return self.columns().as_dicts()
+
+    def generation(self) -> int:
+        """Number that changes exactly when the events in the file have changed"""
+        self.refresh()
+        return self._generation
+
+
+def _complete_lines(chunk: bytes) -> bytes:
+    """Drop a trailing partial line that is still being written"""
+    return chunk[: chunk.rfind(b"\n") + 1]
+
+
+def _encode_date(value: Optional[str]) -> int:
+    return datetime.date.fromisoformat(value or "").toordinal()
+
+
+def _parse_records(
+    chunk: bytes, columns: dict[str, array], vocabulary: Vocabulary
+) -> int:
+    """Encode the CSV records in chunk onto columns; return how many there were"""
+    # Decode incrementally rather than holding the whole chunk as one str
+    text = io.TextIOWrapper(io.BytesIO(chunk), newline="")
+    reader = csv.reader(text, dialect="unix")
+    new_columns = [_new_column(name) for name in columns]
+    encoders: list[Callable[[Optional[str]], int]] = [
+        (
+            _encode_date
+            if name == DATE_COLUMN
+            else functools.partial(vocabulary.encode, name)
+        )
+        for name in columns
+    ]
+    width = len(new_columns)
+    for record in reader:
+        if not record:
+            continue
+        # Fields missing from the end of a malformed row are stored as empty
+        values: list = list(record)
+        values.extend([None] * (width - len(values)))
+        for column, encode, value in zip(new_columns, encoders, values):
+            column.append(encode(value))
+    for column, new_values in zip(columns.values(), new_columns):
+        column.extend(new_values)
+    return len(new_columns[0]) if new_columns else 0
+
+
+_stores: dict[Path, EventStore] = dict()
+_stores_lock = threading.Lock()
+
+
+def get_event_store(persistence_path: Path) -> EventStore:
+    """Return the process-wide store for a path, creating it on first use"""
+    key = persistence_path.resolve()
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = EventStore(persistence_path)
+        return _stores[key]
@@ -0,0 +1,32 @@
+import datetime
+from typing import AbstractSet, NamedTuple, Optional
+
+
+class EventFilter(NamedTuple):
+    """Constraints on event records; an empty constraint matches every event"""
+
+    crops: AbstractSet[str] = frozenset()
+    actions: AbstractSet[str] = frozenset()
+    locations: AbstractSet[str] = frozenset()
+    start_date: Optional[datetime.date] = None
+    end_date: Optional[datetime.date] = None
+
+    def __bool__(self) -> bool:
+        """Whether the filter constrains anything; an empty one matches every event"""
+        return bool(
+            self.crops
+            or self.actions
+            or self.locations
+            or (self.start_date and self.end_date)
+        )
+
+    def matches(self, row: dict) -> bool:
+        if self.crops and row["crop"] not in self.crops:
+            return False
+        if self.actions and row["action"] not in self.actions:
+            return False
+        if self.locations and row["location"] not in self.locations:
+            return False
+        if self.start_date and self.end_date:
+            return self.start_date <= row["date"] <= self.end_date
+        return True
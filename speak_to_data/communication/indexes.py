@@ -0,0 +1,124 @@
+import bisect
+import itertools
+import threading
+from array import array
+from typing import AbstractSet, Mapping, Sequence
+
+
+class PostingIndex:
+    """Row indexes of every code in the indexed columns, in ascending order
+
+    The index reads the encoded columns of one store. A column's posting lists are
+    built on the first lookup and extended with the rows appended since, so
+    looking up a value costs the length of its posting list rather than a scan
+    of the column.
+    """
+
+    def __init__(self, columns: Mapping[str, Sequence[int]]) -> None:
+        self._columns = columns
+        self._postings: dict[str, dict[int, array]] = dict()
+        self._indexed_rows: dict[str, int] = dict()
+        self._lock = threading.Lock()
+
+    def extend(self, row_count: int) -> None:
+        """Add the rows up to row_count to the posting lists built so far"""
+        with self._lock:
+            for name in self._postings:
+                self._add_rows(name, row_count)
+
+    def _add_rows(self, name: str, row_count: int) -> None:
+        column = self._columns[name]
+        postings = self._postings.setdefault(name, dict())
+        start = self._indexed_rows.get(name, 0)
+        # A stable sort groups the new rows by code with each group in row order
+        new_rows = sorted(range(start, row_count), key=column.__getitem__)
+        for code, rows in itertools.groupby(new_rows, key=column.__getitem__):
+            postings.setdefault(code, array("I")).extend(rows)
+        self._indexed_rows[name] = max(start, row_count)
+
+    def rows(self, name: str, codes: AbstractSet[int], row_count: int) -> Sequence[int]:
+        """Ascending indexes below row_count of the rows holding any of the codes"""
+        with self._lock:
+            if self._indexed_rows.get(name, 0) < row_count:
+                self._add_rows(name, row_count)
+            postings = self._postings.get(name, dict())
+            matches = [postings[code] for code in codes if code in postings]
+        # Lists may hold rows past row_count that a newer refresh added
+        matches = [rows[: bisect.bisect_left(rows, row_count)] for rows in matches]
+        if len(matches) == 1:
+            return matches[0]
+        return sorted(itertools.chain.from_iterable(matches))
+
+
+# Out-of-order rows held aside before they are merged into the sorted arrays
+DATE_OVERFLOW_LIMIT = 1024
+
+
+class DateIndex:
+    """Rows of one store ordered by date, for range lookups by binary search
+
+    Events are mostly recorded in date order, so a row whose date is not earlier
+    than the last sorted one is appended to the sorted arrays as it comes. Rows
+    recorded out of order go to a small unsorted overflow, which is merged into
+    the sorted arrays once it holds DATE_OVERFLOW_LIMIT rows.
+    """
+
+    def __init__(self, dates: Sequence[int]) -> None:
+        self._dates = dates
+        self._sorted_dates = array("i")
+        self._sorted_rows = array("I")
+        # Stays true while the sorted rows are also in recorded order
+        self._rows_ascending = True
+        self._overflow: list[tuple[int, int]] = []
+        self._indexed_rows = 0
+        self._lock = threading.Lock()
+
+    def extend(self, row_count: int) -> None:
+        """Add the rows up to row_count, if the index has been built"""
+        with self._lock:
+            if self._indexed_rows:
+                self._add_rows(row_count)
+
+    def _add_rows(self, row_count: int) -> None:
+        dates, sorted_dates = self._dates, self._sorted_dates
+        last = sorted_dates[-1] if sorted_dates else None
+        for row in range(self._indexed_rows, row_count):
+            date = dates[row]
+            if last is None or date >= last:
+                sorted_dates.append(date)
+                self._sorted_rows.append(row)
+                last = date
+            else:
+                self._overflow.append((date, row))
+        self._indexed_rows = max(self._indexed_rows, row_count)
+        if len(self._overflow) >= DATE_OVERFLOW_LIMIT:
+            self._merge_overflow()
+
+    def _merge_overflow(self) -> None:
+        merged = sorted(
+            itertools.chain(zip(self._sorted_dates, self._sorted_rows), self._overflow)
+        )
+        self._sorted_dates = array("i", (date for date, _ in merged))
+        self._sorted_rows = array("I", (row for _, row in merged))
+        self._rows_ascending = False
+        self._overflow = []
+
+    def rows_between(self, start: int, end: int, row_count: int) -> Sequence[int]:
+        """Ascending indexes below row_count of the rows dated start to end
+
+        Both bounds are date ordinals and inclusive. While no row was recorded out
+        of order, the result is a slice of the sorted rows found by two binary
+        searches.
+        """
+        with self._lock:
+            if self._indexed_rows < row_count:
+                self._add_rows(row_count)
+            low = bisect.bisect_left(self._sorted_dates, start)
+            high = bisect.bisect_right(self._sorted_dates, end)
+            span = self._sorted_rows[low:high]
+            overflow = [row for date, row in self._overflow if start <= date <= end]
+            rows_ascending = self._rows_ascending
+        if rows_ascending and not overflow:
+            # Lists may hold rows past row_count that a newer refresh added
+            return span[: bisect.bisect_left(span, row_count)]
+        return sorted(row for row in itertools.chain(span, overflow) if row < row_count)
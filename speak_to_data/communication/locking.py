@@ -0,0 +1,51 @@
+import contextlib
+import os
+from pathlib import Path
+from typing import IO, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None  # type: ignore[assignment]
+
+
+@contextlib.contextmanager
+def locked(handle: IO, exclusive: bool) -> Iterator[None]:
+    """Advisory lock on an open file, shared between readers or held by one writer
+
+    On platforms without fcntl this is a no-op.
+    """
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(handle.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    try:
+        yield
+    finally:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def is_current(handle: IO, path: Path) -> bool:
+    """Whether path still refers to the file the handle was opened on"""
+    try:
+        return os.fstat(handle.fileno()).st_ino == os.stat(path).st_ino
+    except FileNotFoundError:
+        return False
+
+
+@contextlib.contextmanager
+def open_locked(path: Path, mode: str, exclusive: bool) -> Iterator[IO]:
+    """Open and lock the file at path, retrying if it is replaced while waiting
+
+    Compaction swaps in a new file while holding the lock on the old one, so a
+    handle that only gets its lock afterwards would see stale contents.
+    """
+    while True:
+        handle = open(path, mode)
+        try:
+            with locked(handle, exclusive):
+                if is_current(handle, path):
+                    yield handle
+                    return
+        finally:
+            handle.close()
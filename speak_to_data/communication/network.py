@@ -1,5 +1,276 @@
 from collections import namedtuple
+import threading
+import time
+from typing import Callable, NamedTuple, Optional, Union
+
 import requests
+from requests.adapters import HTTPAdapter
+
+# Seconds to wait for the connection, and then for the answer
+Timeout = Union[float, tuple[float, float]]
+DEFAULT_TIMEOUT: Timeout = (3.05, 120.0)
+TIMEOUT_ERROR = "The model did not answer in time. Please try again."
+UNREACHABLE_ERROR = "The model could not be reached. Please try again later."
+CIRCUIT_OPEN_ERROR = (
+    "The model is having trouble at the moment, so it wasn't asked. "
+    "Please try again in a minute."
+)
+BULKHEAD_FULL_ERROR = "The model is busy with other questions. Please try again."
+RATE_LIMITED_ERROR = (
+    "Too many questions are being asked right now. "
+    "Please try again in a few seconds."
+)
+# Connections kept open per host; enough for every parallel model call
+POOL_MAXSIZE = 16
+
+
+class CircuitBreaker:
+    """Stops calling a model that keeps failing, and checks now and then if it is back
+
+    A call fails when it raises, times out, or takes longer than slow_call
+    seconds. After failure_threshold failures in a row the circuit opens and
+    allow refuses every call. After reset_timeout seconds one probe call is
+    allowed: it closes the circuit if it succeeds and opens it again if not.
+    Safe to use from several threads.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        slow_call: float = 30.0,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.slow_call = slow_call
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead; it must then be reported with record"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if (
+                self._state == self.OPEN
+                and self._clock() - self._opened_at >= self.reset_timeout
+            ):
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def cancel(self) -> None:
+        """Hand back what allow granted, for a call that won't be made after all
+
+        A probe that was not sent leaves the circuit open, with the next call
+        allowed to probe.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.OPEN
+
+    def record(self, succeeded: bool, duration: float = 0.0) -> None:
+        with self._lock:
+            if succeeded and duration <= self.slow_call:
+                self._state = self.CLOSED
+                self._failures = 0
+                return
+            self._failures += 1
+            if (
+                self._state == self.HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+
+
+class RateLimiterStats(NamedTuple):
+    admitted: int
+    rejected: int
+    # Calls waiting for a token now, and the most that ever waited at once
+    waiting: int
+    max_waiting: int
+    # Seconds admitted calls spent waiting, in total and at most
+    total_wait: float
+    max_wait: float
+
+
+class RateLimiter:
+    """Token bucket letting calls through at rate per second, in bursts of up to burst
+
+    A call arriving when the bucket is empty reserves the next token and waits
+    for it, first come first served. It is rejected instead when max_queue calls
+    are already waiting, or when its wait would be longer than max_wait seconds.
+    Safe to use from several threads.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        max_queue: int,
+        max_wait: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._refilled_at = clock()
+        self._admitted = self._rejected = self._waiting = self._max_waiting = 0
+        self._total_wait = self._longest_wait = 0.0
+
+    def stats(self) -> RateLimiterStats:
+        with self._lock:
+            return RateLimiterStats(
+                self._admitted,
+                self._rejected,
+                self._waiting,
+                self._max_waiting,
+                self._total_wait,
+                self._longest_wait,
+            )
+
+    def reserve(self) -> Optional[float]:
+        """Seconds to wait before calling, or None if the call is rejected
+
+        A positive wait must be followed by done_waiting once it is over.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._refilled_at) * self.rate
+            )
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self._admitted += 1
+                return 0.0
+            # Tokens below zero are owed to calls already waiting
+            wait = (1 - self._tokens) / self.rate
+            if self._waiting >= self.max_queue or wait > self.max_wait:
+                self._rejected += 1
+                return None
+            self._tokens -= 1
+            self._waiting += 1
+            self._max_waiting = max(self._max_waiting, self._waiting)
+            return wait
+
+    def done_waiting(self, wait: float) -> None:
+        with self._lock:
+            self._waiting -= 1
+            self._admitted += 1
+            self._total_wait += wait
+            self._longest_wait = max(self._longest_wait, wait)
+
+    def refund(self) -> None:
+        """Give back the token of an admitted call that won't be sent after all"""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+            self._admitted -= 1
+
+    def acquire(self, sleep: Callable[[float], None] = time.sleep) -> bool:
+        """Wait for a token; False if the call is rejected"""
+        wait = self.reserve()
+        if wait is None:
+            return False
+        if wait > 0:
+            sleep(wait)
+            self.done_waiting(wait)
+        return True
+
+
+class Bulkhead:
+    """At most max_concurrent calls at once; callers wait up to max_wait for a slot"""
+
+    def __init__(self, max_concurrent: int, max_wait: float = 0.0) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def acquire(self) -> bool:
+        return self._slots.acquire(timeout=self.max_wait)
+
+    def release(self) -> None:
+        self._slots.release()
+
+
+class ResilienceSettings(NamedTuple):
+    failure_threshold: int = 5
+    slow_call: float = 30.0
+    reset_timeout: float = 30.0
+    max_concurrent_calls: int = 8
+    max_wait: float = 0.0
+    calls_per_second: float = 2.0
+    burst: int = 10
+    max_queue: int = 32
+    max_queue_wait: float = 5.0
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_breaker: CircuitBreaker
+_bulkhead: Bulkhead
+_rate_limiter: RateLimiter
+
+
+def configure(settings: ResilienceSettings) -> None:
+    """Set the limits shared by model interfaces made from now on"""
+    global _breaker, _bulkhead, _rate_limiter
+    _breaker = CircuitBreaker(
+        settings.failure_threshold, settings.slow_call, settings.reset_timeout
+    )
+    _bulkhead = Bulkhead(settings.max_concurrent_calls, settings.max_wait)
+    _rate_limiter = RateLimiter(
+        settings.calls_per_second,
+        settings.burst,
+        settings.max_queue,
+        settings.max_queue_wait,
+    )
+
+
+configure(ResilienceSettings())
+
+
+def shared_breaker() -> CircuitBreaker:
+    """The process-wide circuit breaker, so every model call sees the same failures"""
+    return _breaker
+
+
+def shared_rate_limiter() -> RateLimiter:
+    """The process-wide rate limiter, so every model call counts against one quota"""
+    return _rate_limiter
+
+
+def shared_session() -> requests.Session:
+    """The process-wide session, so calls reuse kept-alive connections
+
+    The session is only used to send requests, which urllib3's connection pool
+    allows from several threads at once.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
 
 
 class TapasInterface:
@@ -10,11 +281,96 @@ class TapasInterface:
         "tapas-large-finetuned-wtq",
     )
 
-    def __init__(self, api_token: str):
+    def __init__(
+        self,
+        api_token: str,
+        timeout: Timeout = DEFAULT_TIMEOUT,
+        full_url: Optional[str] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        bulkhead: Optional[Bulkhead] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
         self.api_token = api_token
-        self.full_url = "/".join(TapasInterface.tapas_large)
+        self.timeout = timeout
+        self.full_url = full_url or "/".join(TapasInterface.tapas_large)
+        self.session = shared_session()
+        self.breaker = breaker or shared_breaker()
+        self.bulkhead = bulkhead or _bulkhead
+        self.rate_limiter = rate_limiter or shared_rate_limiter()
 
     def call_model_api(self, payload: dict) -> dict:
-        headers = {"Authorization": f"Bearer {self.api_token}"}
-        response = requests.post(self.full_url, headers=headers, json=payload)
+        """The model's answer, or an error to show when it can't or shouldn't be asked
+
+        Calls are refused at once while the circuit breaker is open. Others wait
+        their turn at the rate limiter, and are refused when its queue is full or
+        when the process already has as many model calls in flight as the
+        bulkhead allows. Only calls that are sent use up a token.
+        """
+        if not self.breaker.allow():
+            return {"error": CIRCUIT_OPEN_ERROR}
+        if not self.rate_limiter.acquire():
+            self.breaker.cancel()
+            return {"error": RATE_LIMITED_ERROR}
+        if not self.bulkhead.acquire():
+            self.rate_limiter.refund()
+            self.breaker.cancel()
+            return {"error": BULKHEAD_FULL_ERROR}
+        try:
+            started = time.monotonic()
+            try:
+                model_response = self._post(payload)
+            except BaseException:
+                self.breaker.record(False)
+                raise
+            self.breaker.record(
+                not is_upstream_failure(model_response), time.monotonic() - started
+            )
+            return model_response
+        except requests.Timeout:
+            return {"error": TIMEOUT_ERROR}
+        except requests.RequestException:
+            return {"error": UNREACHABLE_ERROR}
+        finally:
+            self.bulkhead.release()
+
+    def _post(self, payload: dict) -> dict:
+        return post_payload(
+            self.session, self.full_url, self.api_token, payload, self.timeout
+        )
+
+
+def post_payload(
+    session: requests.Session,
+    full_url: str,
+    api_token: str,
+    payload: dict,
+    timeout: Timeout,
+) -> dict:
+    """Send one payload to the model and return its JSON, without any limits
+
+    Raises requests.Timeout or another requests.RequestException when no JSON
+    comes back.
+    """
+    headers = {"Authorization": f"Bearer {api_token}"}
+    response = session.post(full_url, headers=headers, json=payload, timeout=timeout)
+    try:
         return response.json()
+    except ValueError:
+        raise requests.RequestException(
+            f"The model answered {response.status_code} without JSON"
+        )
+
+
+def is_upstream_failure(model_response: dict) -> bool:
+    """Whether a model response says the service itself is failing
+
+    TaPas reports loading and problems with the input in plain words; any other
+    error counts against the circuit breaker.
+    """
+    error = model_response.get("error")
+    if error is None:
+        return False
+    return not any(
+        reason in error
+        for reason in ("currently loading", "table is empty", "query is empty")
+    )
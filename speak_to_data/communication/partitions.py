@@ -0,0 +1,120 @@
+import datetime
+import re
+from pathlib import Path
+from typing import Optional
+
+from speak_to_data.communication import persistence, writer
+
+PARTITION_PATTERN = re.compile(r"^(\d{4})-(\d{2})\.csv$")
+
+
+def partition_path(partition_dir: Path, event_date: str) -> Path:
+    """The monthly CSV file, e.g. events/2023-04.csv, an event belongs in"""
+    date = datetime.date.fromisoformat(event_date)
+    return partition_dir / f"{date.year:04d}-{date.month:02d}.csv"
+
+
+def _partitions(partition_dir: Path) -> list[tuple[tuple[int, int], Path]]:
+    """(year, month) and path of every partition, oldest first"""
+    found = []
+    for path in partition_dir.iterdir():
+        if match := PARTITION_PATTERN.match(path.name):
+            found.append(((int(match[1]), int(match[2])), path))
+    return sorted(found)
+
+
+def initialise_store(partition_dir: Path, fieldnames: list[str]) -> None:
+    partition_dir.mkdir(parents=True, exist_ok=True)
+
+
+def persist_event(
+    event_data: dict[str, str], partition_dir: Path, fieldnames: list[str]
+) -> None:
+    if not partition_dir.is_dir():
+        raise FileNotFoundError(
+            f"Trying to store the record at {partition_dir} "
+            f"but this is not a valid path."
+        )
+    path = partition_path(partition_dir, event_data["date"])
+    persistence.initialise_store(path, fieldnames)
+    persistence.persist_event(event_data, path, fieldnames)
+
+
+def read_dataset(
+    partition_dir: Path, event_filter: Optional[persistence.EventFilter] = None
+) -> list[dict]:
+    """Events matching the filter, reading only the months in its date range
+
+    Events come back ordered by month, and in the order they were recorded within
+    each month.
+    """
+    if not partition_dir.is_dir():
+        raise FileNotFoundError(
+            f"Trying to read from {partition_dir} but this is not a valid path."
+        )
+    dataset = []
+    for path in _partitions_in_range(partition_dir, event_filter):
+        dataset.extend(persistence.read_dataset(path, event_filter))
+    return dataset
+
+
+def _partitions_in_range(
+    partition_dir: Path, event_filter: Optional[persistence.EventFilter]
+) -> list[Path]:
+    """Paths of the partitions for the months in the filter's date range, or all"""
+    partitions = _partitions(partition_dir)
+    if event_filter and event_filter.start_date and event_filter.end_date:
+        first = (event_filter.start_date.year, event_filter.start_date.month)
+        last = (event_filter.end_date.year, event_filter.end_date.month)
+        partitions = [
+            (month, path) for month, path in partitions if first <= month <= last
+        ]
+    return [path for _, path in partitions]
+
+
+def data_generation(
+    partition_dir: Path, event_filter: Optional[persistence.EventFilter] = None
+) -> int:
+    """Sum of the generations of the monthly partitions in the filter's date range
+
+    Each partition's generation only goes up and a new one starts above 0, so the
+    sum goes up whenever a partition in the range changes or is created. Only
+    those partitions are opened.
+    """
+    if not partition_dir.is_dir():
+        raise FileNotFoundError(
+            f"Trying to read from {partition_dir} but this is not a valid path."
+        )
+    return sum(
+        persistence.data_generation(path)
+        for path in _partitions_in_range(partition_dir, event_filter)
+    )
+
+
+def compact(partition_dir: Path) -> int:
+    """Fold every monthly partition into its own snapshot"""
+    return sum(persistence.compact(path) for _, path in _partitions(partition_dir))
+
+
+def split_into_partitions(
+    csv_path: Path, partition_dir: Path, fieldnames: list[str]
+) -> int:
+    """Copy every event in a single CSV store into monthly partitions
+
+    Returns the number of copied events. Events are appended, so partitions that
+    already exist keep their contents.
+    """
+    initialise_store(partition_dir, fieldnames)
+    by_partition: dict[Path, list[dict]] = dict()
+    for row in persistence.iter_dataset(csv_path):
+        path = partition_path(partition_dir, row["date"].isoformat())
+        by_partition.setdefault(path, []).append(row)
+    for path, rows in by_partition.items():
+        persistence.initialise_store(path, fieldnames)
+        # A writer of its own, closed straight away: past months get no more rows
+        partition_writer = writer.new_writer(path, fieldnames)
+        try:
+            partition_writer.write_many(rows)
+        finally:
+            partition_writer.close()
+    return sum(len(rows) for rows in by_partition.values())
@@ -1,46 +1,195 @@
 import csv
 import datetime
+import io
 import json
+import os
+import threading
 from pathlib import Path
+from typing import Iterator, Optional
+
+from speak_to_data.communication import (
+    event_store,
+    filters,
+    locking,
+    snapshot,
+    writer,
+)
+
+EventFilter = filters.EventFilter
+
+
+def initialise_store(persistence_path: Path, fieldnames: list[str]) -> None:
+    """Create the events file with its header row if it doesn't exist yet
+
+    The header is written to a private temporary file which is then hard linked
+    into place. Linking fails if the file already exists, so when several worker
+    processes start at once exactly one of them creates the file, and no process
+    ever sees it without its header. On filesystems without hard links the file
+    is created empty instead, and the header written under the file's lock.
+    """
+    if persistence_path.is_file():
+        return
+    temporary_path = persistence_path.with_name(
+        f".{persistence_path.name}.{os.getpid()}.{threading.get_ident()}"
+    )
+    try:
+        with open(temporary_path, "w", newline="") as event_record:
+            w = csv.DictWriter(event_record, fieldnames=fieldnames, dialect="unix")
+            w.writeheader()
+        os.link(temporary_path, persistence_path)
+    except FileExistsError:
+        pass
+    except OSError:
+        _create_without_link(persistence_path, fieldnames)
+    finally:
+        temporary_path.unlink(missing_ok=True)
+
+
+def _create_without_link(persistence_path: Path, fieldnames: list[str]) -> None:
+    """Create the file exclusively, then give it a header if it has none yet
+
+    Every process starting up writes the header when it finds the file empty
+    under the exclusive lock, so whichever gets there first writes it once and
+    none returns before it is there. Readers meanwhile see an empty file.
+    """
+    try:
+        open(persistence_path, "x").close()
+    except FileExistsError:
+        pass
+    header = io.StringIO()
+    csv.DictWriter(header, fieldnames=fieldnames, dialect="unix").writeheader()
+    with locking.open_locked(persistence_path, "ab", exclusive=True) as handle:
+        if os.fstat(handle.fileno()).st_size:
+            return
+        handle.write(header.getvalue().encode())
+        handle.flush()
+        os.fsync(handle.fileno())
 
 
 def persist_event(
     event_data: dict[str, str], persistence_path: Path, fieldnames: list[str]
 ) -> None:
-    if not persistence_path.is_file():
-        raise FileNotFoundError(
-            f"Trying to store the record at {persistence_path} "
-            f"but this is not a valid path."
-        )
+    """Append one event; returns once it is durable under the writer's fsync policy"""
     try:
-        with open(persistence_path, "a", newline="") as events_store:
-            w = csv.DictWriter(
-                events_store,
-                fieldnames=fieldnames,
-                dialect="unix",
-                extrasaction="ignore",
-            )
-            w.writerow(event_data)
+        writer.get_writer(persistence_path, fieldnames).write(event_data)
     except PermissionError as pe:
         raise PermissionError(f"Not allowed to write to file {pe.filename}")
 
 
-def read_dataset(persistence_path: Path) -> list[dict]:
+def read_columns(persistence_path: Path) -> event_store.EventColumns:
+    """Up to date encoded columns from the process-wide cache of the file"""
     if not persistence_path.is_file():
         raise FileNotFoundError(
             f"Trying to read from {persistence_path} but this is not a valid path."
         )
-    full_dataset = []
     try:
-        with open(persistence_path, newline="") as events_store:
-            dr = csv.DictReader(events_store, dialect="unix")
-            for row in dr:
-                date_object = datetime.date.fromisoformat(row["date"])
-                row["date"] = date_object
-                full_dataset.append(row)
+        return event_store.get_event_store(persistence_path).columns()
     except PermissionError as pe:
         raise PermissionError(f"Not allowed to read from file at:\n{pe.filename}")
-    return full_dataset
+
+
+def data_generation(
+    persistence_path: Path, event_filter: Optional[EventFilter] = None
+) -> int:
+    """Generation of the events in the file; goes up whenever they change
+
+    The whole file is one store, so the filter makes no difference.
+    """
+    read_columns(persistence_path)
+    return event_store.get_event_store(persistence_path).generation()
+
+
+def read_dataset(
+    persistence_path: Path, event_filter: Optional[EventFilter] = None
+) -> list[dict]:
+    """Events matching the filter, from the process-wide cache of the file
+
+    The filter is applied to the encoded columns, so only matching events are
+    turned into dicts.
+    """
+    columns = read_columns(persistence_path)
+    if not event_filter:
+        return columns.as_dicts()
+    return columns.as_dicts(columns.select(event_filter))
+
+
+def iter_dataset(
+    persistence_path: Path, event_filter: Optional[EventFilter] = None
+) -> Iterator[dict]:
+    """Stream the events matching the filter straight from disk, without caching
+
+    A snapshot, if there is one, is scanned in place through a memory map. The CSV
+    is parsed one line at a time, checking the crop, action and location on the
+    raw strings before the date is parsed. Only matching events become dicts, so
+    memory use follows the size of the result rather than the size of the file.
+    A shared lock is held on the CSV until the generator is exhausted or closed.
+    """
+    if not persistence_path.is_file():
+        raise FileNotFoundError(
+            f"Trying to read from {persistence_path} but this is not a valid path."
+        )
+    with locking.open_locked(persistence_path, "rb", exclusive=False) as raw_store:
+        header = raw_store.readline().decode()
+        fieldnames = next(csv.reader(io.StringIO(header), dialect="unix"), [])
+        with snapshot.map_snapshot(snapshot.snapshot_path(persistence_path)) as mapped:
+            if mapped and list(mapped.columns) == fieldnames:
+                vocabulary = event_store.Vocabulary(mapped.vocabulary)
+                indexes = event_store.matching_rows(
+                    mapped.columns, vocabulary, mapped.row_count, event_filter
+                )
+                yield from event_store.decode_rows(mapped.columns, vocabulary, indexes)
+                # Bytes the snapshot holds if compaction stopped before truncating
+                covered = snapshot.covered_bytes(mapped.source, raw_store)
+                raw_store.seek(max(raw_store.tell(), covered))
+        events_store = io.TextIOWrapper(raw_store, newline="")
+        reader = csv.reader(events_store, dialect="unix")
+        yield from _filter_records(reader, fieldnames, event_filter)
+        events_store.detach()
+
+
+def _filter_records(
+    records: Iterator[list[str]],
+    fieldnames: list[str],
+    event_filter: Optional[EventFilter],
+) -> Iterator[dict]:
+    string_checks = []
+    start_date = end_date = None
+    if event_filter:
+        for name, values in (
+            ("crop", event_filter.crops),
+            ("action", event_filter.actions),
+            ("location", event_filter.locations),
+        ):
+            if values:
+                if name not in fieldnames:
+                    return
+                string_checks.append((fieldnames.index(name), values))
+        if event_filter.start_date and event_filter.end_date:
+            if "date" not in fieldnames:
+                return
+            start_date, end_date = event_filter.start_date, event_filter.end_date
+    date_idx = fieldnames.index("date") if "date" in fieldnames else None
+    for record in records:
+        if not record:
+            continue
+        if not all(record[idx] in values for idx, values in string_checks):
+            continue
+        row: dict = dict(zip(fieldnames, record))
+        if date_idx is not None:
+            date = datetime.date.fromisoformat(record[date_idx])
+            if start_date and end_date and not start_date <= date <= end_date:
+                continue
+            row["date"] = date
+        yield row
+
+
+def compact(persistence_path: Path) -> int:
+    """Fold the CSV into its binary snapshot, leaving an empty CSV delta"""
+    if not persistence_path.is_file():
+        raise FileNotFoundError(
+            f"Trying to compact {persistence_path} but this is not a valid path."
+        )
+    return event_store.get_event_store(persistence_path).compact()
 
 
 def read_json(path: Path) -> dict[str, str]:
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+
+def cache_key(query: str, table: dict[str, list]) -> str:
+    """Digest of a question and the exact table it is asked about
+
+    The table is serialised canonically, so equal tables give equal keys no
+    matter how they were built.
+    """
+    canonical = json.dumps(
+        {"query": query, "table": table},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    disk_hits: int
+    misses: int
+    entries: int
+
+
+class _Entry(NamedTuple):
+    stored_at: float
+    generation: Optional[int]
+    response: dict
+
+
+class ResponseCache:
+    """Model responses by cache key, least recently used first out, for ttl seconds
+
+    Holds at most max_entries responses in memory. With a directory, every
+    response is also written there as one JSON file, and a key missing from
+    memory is looked up on disk, so the cache survives restarts. The directory
+    keeps the max_entries most recently written files, and files found expired
+    are deleted. Safe to use from several threads.
+
+    A response can be stamped with the data generation it was computed from, see
+    persistence.data_generation; it is then only returned for that generation.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        directory: Optional[Path] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self._clock = clock
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._disk_hits = self._misses = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                self._hits, self._disk_hits, self._misses, len(self._entries)
+            )
+
+    def _is_valid(self, entry: Optional[_Entry], generation: Optional[int]) -> bool:
+        return bool(
+            entry
+            and self._clock() - entry.stored_at <= self.ttl
+            and entry.generation == generation
+        )
+
+    def get(self, key: str, generation: Optional[int] = None) -> Optional[dict]:
+        """The cached response, or None if missing, expired or of another generation"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and self._is_valid(entry, generation):
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry.response
+            if entry:
+                del self._entries[key]
+        entry = self._read(key)
+        with self._lock:
+            if entry and self._is_valid(entry, generation):
+                self._remember(key, entry)
+                self._disk_hits += 1
+                return entry.response
+            self._misses += 1
+        if entry:
+            # Expired, or computed from older data, which never comes back
+            self._remove(key)
+        return None
+
+    def put(self, key: str, response: dict, generation: Optional[int] = None) -> None:
+        entry = _Entry(self._clock(), generation, response)
+        with self._lock:
+            self._remember(key, entry)
+        self._write(key, entry)
+
+    def _remember(self, key: str, entry: _Entry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _path(self, key: str) -> Optional[Path]:
+        return self.directory / f"{key}.json" if self.directory else None
+
+    def _read(self, key: str) -> Optional[_Entry]:
+        path = self._path(key)
+        if not path:
+            return None
+        try:
+            with open(path) as cached:
+                stored = json.load(cached)
+        except (OSError, ValueError):
+            return None
+        return _Entry(stored["stored_at"], stored.get("generation"), stored["response"])
+
+    def _write(self, key: str, entry: _Entry) -> None:
+        """Store an entry on disk; a cache that can't be written is only slower"""
+        path = self._path(key)
+        if not path:
+            return
+        temporary_path = path.with_name(
+            f".{path.name}.{os.getpid()}.{threading.get_ident()}"
+        )
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temporary_path, "w") as cached:
+                json.dump(entry._asdict(), cached)
+            os.replace(temporary_path, path)
+        except OSError:
+            temporary_path.unlink(missing_ok=True)
+            return
+        self._prune(path.parent)
+
+    def _remove(self, key: str) -> None:
+        path = self._path(key)
+        if path:
+            try:
+                path.unlink(missing_ok=True)
+            except OSError:
+                pass
+
+    def _prune(self, directory: Path) -> None:
+        """Delete the least recently written files beyond max_entries"""
+        try:
+            files = [
+                (entry.stat().st_mtime_ns, entry.path)
+                for entry in os.scandir(directory)
+                if entry.name.endswith(".json") and not entry.name.startswith(".")
+            ]
+        except OSError:
+            return
+        if len(files) <= self.max_entries:
+            return
+        files.sort()
+        for _, path in files[: len(files) - self.max_entries]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
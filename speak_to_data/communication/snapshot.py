@@ -0,0 +1,210 @@
+import contextlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import IO, Iterator, NamedTuple, Optional, Sequence
+
+# File layout: MAGIC, the length of the JSON header as a little-endian uint32, the
+# JSON header itself, then one array per column. Every array starts on an
+# ALIGNMENT boundary so that the file can be mapped and viewed in place.
+MAGIC = b"STDSNAP1"
+ALIGNMENT = 8
+
+
+class Source(NamedTuple):
+    """The CSV bytes a snapshot was taken from
+
+    The file's inode, how many bytes of it the snapshot holds, and the last few
+    of those bytes, so a reader can tell whether the CSV still starts with them.
+    """
+
+    inode: int
+    length: int
+    tail: bytes
+
+
+class Snapshot(NamedTuple):
+    columns: dict[str, array]
+    vocabulary: dict[str, list[str]]
+    row_count: int
+    source: Optional[Source] = None
+
+
+def snapshot_path(persistence_path: Path) -> Path:
+    """Where the snapshot of a CSV event store lives, e.g. events.snapshot"""
+    return persistence_path.with_suffix(".snapshot")
+
+
+def covered_bytes(source: Optional[Source], events_file: IO[bytes]) -> int:
+    """How many leading bytes of the open CSV the snapshot already holds
+
+    Compaction writes the snapshot before it truncates the CSV, so if it stopped
+    in between, the CSV still starts with the bytes the snapshot was taken from
+    and those must be skipped. Once truncated, the CSV is all new and this is 0.
+    """
+    if source is None or os.fstat(events_file.fileno()).st_ino != source.inode:
+        return 0
+    position = events_file.tell()
+    events_file.seek(source.length - len(source.tail))
+    holds_source = events_file.read(len(source.tail)) == source.tail
+    events_file.seek(position)
+    return source.length if holds_source else 0
+
+
+def _padding(position: int) -> bytes:
+    return bytes(-position % ALIGNMENT)
+
+
+def write_snapshot(path: Path, snapshot: Snapshot) -> None:
+    """Write a snapshot next to path and atomically move it into place"""
+    sections = []
+    offset = 0
+    for name, column in snapshot.columns.items():
+        data = column[: snapshot.row_count].tobytes()
+        sections.append(
+            {
+                "name": name,
+                "typecode": column.typecode,
+                "itemsize": column.itemsize,
+                "offset": offset,
+                "length": len(data),
+            }
+        )
+        offset += len(data) + len(_padding(len(data)))
+    source = snapshot.source
+    header = json.dumps(
+        {
+            "byteorder": sys.byteorder,
+            "row_count": snapshot.row_count,
+            "source": (
+                {
+                    "inode": source.inode,
+                    "length": source.length,
+                    "tail": source.tail.hex(),
+                }
+                if source
+                else None
+            ),
+            "columns": sections,
+            "vocabulary": snapshot.vocabulary,
+        }
+    ).encode()
+    preamble = MAGIC + struct.pack("<I", len(header)) + header
+    preamble += _padding(len(preamble))
+
+    temporary_path = path.with_name(f".{path.name}.{os.getpid()}")
+    with open(temporary_path, "wb") as snapshot_file:
+        snapshot_file.write(preamble)
+        for column in snapshot.columns.values():
+            data = column[: snapshot.row_count].tobytes()
+            snapshot_file.write(data + _padding(len(data)))
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temporary_path, path)
+
+
+def _sections(path: Path, mapped: mmap.mmap, views: list[memoryview]):
+    """Parse the header and slice out the raw bytes of each column
+
+    Every memoryview created is added to views, so the caller can release them
+    before the map is closed.
+    """
+    if mapped[: len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not an event snapshot")
+    (header_length,) = struct.unpack_from("<I", mapped, len(MAGIC))
+    header_start = len(MAGIC) + 4
+    header = json.loads(mapped[header_start : header_start + header_length])
+    data_start = header_start + header_length
+    data_start += len(_padding(data_start))
+
+    view = memoryview(mapped)
+    views.append(view)
+    sections = dict()
+    for section in header["columns"]:
+        if array(section["typecode"]).itemsize != section["itemsize"]:
+            raise ValueError(f"{path} was written on an incompatible platform")
+        start = data_start + section["offset"]
+        data = view[start : start + section["length"]]
+        views.append(data)
+        sections[section["name"]] = (section["typecode"], data)
+    return header, sections
+
+
+def _source(header: dict) -> Optional[Source]:
+    source = header.get("source")
+    if source is None:
+        return None
+    return Source(source["inode"], source["length"], bytes.fromhex(source["tail"]))
+
+
+class MappedSnapshot(NamedTuple):
+    columns: dict[str, Sequence[int]]
+    vocabulary: dict[str, list[str]]
+    row_count: int
+    source: Optional[Source] = None
+
+
+@contextlib.contextmanager
+def map_snapshot(path: Path) -> Iterator[Optional[MappedSnapshot]]:
+    """Map a snapshot and view its columns in place, without copying them
+
+    Yields None if there is no snapshot. The column views are only valid inside
+    the with block.
+    """
+    try:
+        snapshot_file = open(path, "rb")
+    except FileNotFoundError:
+        yield None
+        return
+    views: list[memoryview] = []
+    with snapshot_file, mmap.mmap(
+        snapshot_file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        try:
+            header, sections = _sections(path, mapped, views)
+            columns: dict[str, Sequence[int]] = dict()
+            for name, (typecode, data) in sections.items():
+                if header["byteorder"] == sys.byteorder:
+                    column_view = data.cast(typecode)
+                    views.append(column_view)
+                    columns[name] = column_view
+                else:
+                    column = array(typecode)
+                    column.frombytes(data)
+                    column.byteswap()
+                    columns[name] = column
+            yield MappedSnapshot(
+                columns, header["vocabulary"], header["row_count"], _source(header)
+            )
+        finally:
+            for view in reversed(views):
+                view.release()
+
+
+def read_snapshot(path: Path) -> Optional[Snapshot]:
+    """Map a snapshot file and copy its columns out, or None if there isn't one"""
+    try:
+        snapshot_file = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    views: list[memoryview] = []
+    with snapshot_file, mmap.mmap(
+        snapshot_file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        try:
+            header, sections = _sections(path, mapped, views)
+            columns: dict[str, array] = dict()
+            for name, (typecode, data) in sections.items():
+                column = array(typecode)
+                column.frombytes(data)
+                if header["byteorder"] != sys.byteorder:
+                    column.byteswap()
+                columns[name] = column
+        finally:
+            for view in reversed(views):
+                view.release()
+    return Snapshot(columns, header["vocabulary"], header["row_count"], _source(header))
@@ -0,0 +1,196 @@
+import datetime
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+from speak_to_data.communication import persistence
+from speak_to_data.communication.persistence import EventFilter
+
+TABLE_NAME = "events"
+INDEXED_COLUMNS = ("date", "crop", "action", "location")
+
+_connections = threading.local()
+
+
+def _inode(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def _connect(persistence_path: Path) -> sqlite3.Connection:
+    """One connection per thread and database file, opened on first use
+
+    A cached connection is replaced when the file it was opened on has been
+    deleted or replaced since.
+    """
+    if not hasattr(_connections, "by_path"):
+        _connections.by_path = dict()
+    key = str(persistence_path.resolve())
+    cached = _connections.by_path.get(key)
+    if cached and cached[0] == _inode(key):
+        return cached[1]
+    if cached:
+        cached[1].close()
+    connection = sqlite3.connect(key)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    _connections.by_path[key] = (_inode(key), connection)
+    return connection
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def initialise_store(persistence_path: Path, fieldnames: list[str]) -> None:
+    """Create the events table and its indexes if they don't exist yet"""
+    columns = ", ".join(
+        f"{_quote(name)} TEXT NOT NULL DEFAULT ''" for name in fieldnames
+    )
+    try:
+        connection = _connect(persistence_path)
+    except sqlite3.OperationalError as oe:
+        raise OSError(f"Cannot open the event database at {persistence_path}: {oe}")
+    with connection:
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLE_NAME} "
+            f"(id INTEGER PRIMARY KEY, {columns})"
+        )
+        for name in INDEXED_COLUMNS:
+            if name in fieldnames:
+                connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {TABLE_NAME}_{name} "
+                    f"ON {TABLE_NAME} ({_quote(name)})"
+                )
+
+
+def _normalise_date(value: str) -> str:
+    """Store dates zero-padded so that text comparison matches date order"""
+    try:
+        return datetime.date.fromisoformat(value).isoformat()
+    except ValueError:
+        return value
+
+
+def _column_value(row: dict, name: str) -> str:
+    value = str(row.get(name) or "")
+    return _normalise_date(value) if name == "date" else value
+
+
+def _insert(connection: sqlite3.Connection, rows, fieldnames: list[str]) -> int:
+    columns = ", ".join(_quote(name) for name in fieldnames)
+    placeholders = ", ".join("?" for _ in fieldnames)
+    values = (tuple(_column_value(row, name) for name in fieldnames) for row in rows)
+    cursor = connection.executemany(
+        f"INSERT INTO {TABLE_NAME} ({columns}) VALUES ({placeholders})", values
+    )
+    return cursor.rowcount
+
+
+def persist_event(
+    event_data: dict[str, str], persistence_path: Path, fieldnames: list[str]
+) -> None:
+    if not persistence_path.is_file():
+        raise FileNotFoundError(
+            f"Trying to store the record at {persistence_path} "
+            f"but this is not a valid path."
+        )
+    try:
+        with _connect(persistence_path) as connection:
+            _insert(connection, (event_data,), fieldnames)
+    except sqlite3.OperationalError as oe:
+        raise PermissionError(f"Not allowed to write to file {persistence_path}: {oe}")
+
+
+def _where_clause(event_filter: Optional[EventFilter]) -> tuple[str, list[str]]:
+    if not event_filter:
+        return "", []
+    conditions: list[str] = []
+    parameters: list[str] = []
+    for name, values in (
+        ("crop", event_filter.crops),
+        ("action", event_filter.actions),
+        ("location", event_filter.locations),
+    ):
+        if values:
+            placeholders = ", ".join("?" for _ in values)
+            conditions.append(f"{_quote(name)} IN ({placeholders})")
+            parameters.extend(sorted(values))
+    if event_filter.start_date and event_filter.end_date:
+        conditions.append("date BETWEEN ? AND ?")
+        parameters.extend(
+            (event_filter.start_date.isoformat(), event_filter.end_date.isoformat())
+        )
+    if not conditions:
+        return "", []
+    return " WHERE " + " AND ".join(conditions), parameters
+
+
+def read_dataset(
+    persistence_path: Path, event_filter: Optional[EventFilter] = None
+) -> list[dict]:
+    """Events matching the filter, in the order they were recorded"""
+    if not persistence_path.is_file():
+        raise FileNotFoundError(
+            f"Trying to read from {persistence_path} but this is not a valid path."
+        )
+    where, parameters = _where_clause(event_filter)
+    try:
+        cursor = _connect(persistence_path).execute(
+            f"SELECT * FROM {TABLE_NAME}{where} ORDER BY id", parameters
+        )
+    except sqlite3.OperationalError as oe:
+        raise PermissionError(
+            f"Not allowed to read from file at:\n{persistence_path}: {oe}"
+        )
+    fieldnames = [column[0] for column in cursor.description][1:]
+    dataset = []
+    for record in cursor:
+        row = dict(zip(fieldnames, record[1:]))
+        row["date"] = datetime.date.fromisoformat(row["date"])
+        dataset.append(row)
+    return dataset
+
+
+def data_generation(
+    persistence_path: Path, event_filter: Optional[EventFilter] = None
+) -> int:
+    """Id of the last recorded event
+
+    Events are only ever inserted, so the id goes up with every persisted or
+    migrated event. Covers the whole table whatever the filter.
+    """
+    if not persistence_path.is_file():
+        raise FileNotFoundError(
+            f"Trying to read from {persistence_path} but this is not a valid path."
+        )
+    try:
+        (last_id,) = (
+            _connect(persistence_path)
+            .execute(f"SELECT max(id) FROM {TABLE_NAME}")
+            .fetchone()
+        )
+    except sqlite3.OperationalError as oe:
+        raise PermissionError(
+            f"Not allowed to read from file at:\n{persistence_path}: {oe}"
+        )
+    return last_id or 0
+
+
+def migrate_from_csv(
+    csv_path: Path, persistence_path: Path, fieldnames: list[str]
+) -> int:
+    """Copy every event from a CSV store into an empty database, in one transaction
+
+    Returns the number of migrated events. A database that already holds events is
+    left alone, so running the migration twice doesn't duplicate them.
+    """
+    initialise_store(persistence_path, fieldnames)
+    with _connect(persistence_path) as connection:
+        if connection.execute(f"SELECT 1 FROM {TABLE_NAME} LIMIT 1").fetchone():
+            return 0
+        return _insert(connection, persistence.iter_dataset(csv_path), fieldnames)
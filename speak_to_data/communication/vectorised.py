@@ -0,0 +1,144 @@
+import threading
+from array import array
+from typing import Any, NamedTuple, Optional
+
+from speak_to_data.communication.event_store import (
+    DATE_COLUMN,
+    EventColumns,
+    Vocabulary,
+)
+from speak_to_data.communication.filters import EventFilter
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional; callers check AVAILABLE
+    numpy = None  # type: ignore[assignment]
+
+AVAILABLE = numpy is not None
+
+# Days between 0001-01-01, ordinal 1, and the datetime64 epoch 1970-01-01
+_EPOCH_ORDINAL = 719163
+# Key of the store's arrays in EventColumns.derived
+_DERIVED_KEY = "numpy"
+_derived_lock = threading.Lock()
+
+
+class _ColumnArrays:
+    """NumPy copies of one store's columns, extended with the rows appended since
+
+    Rows are copied once, into arrays that double in size when they fill up, so
+    reading the first row_count rows is a view rather than a copy. Rows below the
+    copied count never change, since the store only ever extends its columns.
+    """
+
+    def __init__(self, columns: dict[str, array]) -> None:
+        self._columns = columns
+        self._codes = {
+            name: numpy.empty(0, dtype=column.typecode)
+            for name, column in columns.items()
+            if name != DATE_COLUMN
+        }
+        self._dates = numpy.empty(0, dtype="datetime64[D]")
+        self._row_count = 0
+        self._lock = threading.Lock()
+
+    def view(self, row_count: int) -> tuple[Any, dict[str, Any]]:
+        """Dates and codes of the first row_count rows, as views into the arrays"""
+        with self._lock:
+            if self._row_count < row_count:
+                self._add_rows(row_count)
+            codes = {name: codes[:row_count] for name, codes in self._codes.items()}
+            return self._dates[:row_count], codes
+
+    def _add_rows(self, row_count: int) -> None:
+        start = self._row_count
+        if row_count > len(self._dates):
+            capacity = max(row_count, 2 * len(self._dates))
+            self._dates = _grown(self._dates, start, capacity)
+            for name, codes in self._codes.items():
+                self._codes[name] = _grown(codes, start, capacity)
+        for name, codes in self._codes.items():
+            column = self._columns[name]
+            codes[start:row_count] = numpy.frombuffer(
+                column[start:row_count], dtype=column.typecode
+            )
+        if DATE_COLUMN in self._columns:
+            column = self._columns[DATE_COLUMN]
+            ordinals = numpy.frombuffer(column[start:row_count], dtype=column.typecode)
+            days = ordinals - _EPOCH_ORDINAL
+            self._dates[start:row_count] = days.astype("datetime64[D]")
+        else:
+            self._dates[start:row_count] = numpy.datetime64(-_EPOCH_ORDINAL, "D")
+        self._row_count = row_count
+
+
+def _grown(values: Any, filled: int, capacity: int) -> Any:
+    grown = numpy.empty(capacity, dtype=values.dtype)
+    grown[:filled] = values[:filled]
+    return grown
+
+
+class VectorisedColumns(NamedTuple):
+    """The first row_count events of a store as NumPy arrays
+
+    Dates are datetime64[D] and every other column holds the integer codes of
+    the store's vocabulary, so filters are boolean masks over whole columns.
+    The arrays are views of copies kept with the store's columns; treat them as
+    read-only.
+    """
+
+    dates: Any
+    codes: dict[str, Any]
+    vocabulary: Vocabulary
+    row_count: int
+
+    @classmethod
+    def from_columns(cls, event_columns: EventColumns) -> "VectorisedColumns":
+        """The columns as arrays, copied once per load of the store
+
+        Later calls for the same load only copy the rows appended since.
+        """
+        if numpy is None:
+            raise RuntimeError("The vectorised query mode needs NumPy installed")
+        derived = event_columns.derived
+        if derived is None:
+            derived = dict()
+        with _derived_lock:
+            if _DERIVED_KEY not in derived:
+                derived[_DERIVED_KEY] = _ColumnArrays(event_columns.columns)
+            column_arrays: _ColumnArrays = derived[_DERIVED_KEY]
+        row_count = event_columns.row_count
+        dates, codes = column_arrays.view(row_count)
+        return cls(dates, codes, event_columns.vocabulary, row_count)
+
+    def mask(self, event_filter: Optional[EventFilter]) -> Any:
+        """Boolean array that is true for the rows matching the filter"""
+        mask = numpy.ones(self.row_count, dtype=bool)
+        if not event_filter:
+            return mask
+        for name, values in (
+            ("crop", event_filter.crops),
+            ("action", event_filter.actions),
+            ("location", event_filter.locations),
+        ):
+            if values and name not in self.codes:
+                mask[:] = False
+            elif values:
+                known = (self.vocabulary.code(name, value) for value in values)
+                codes = [code for code in known if code is not None]
+                mask &= numpy.isin(self.codes[name], codes)
+        if event_filter.start_date and event_filter.end_date:
+            mask &= self.dates >= numpy.datetime64(event_filter.start_date, "D")
+            mask &= self.dates <= numpy.datetime64(event_filter.end_date, "D")
+        return mask
+
+    def select(self, event_filter: Optional[EventFilter]) -> Any:
+        """Indexes of the rows that match the filter, in recorded order"""
+        return numpy.flatnonzero(self.mask(event_filter))
+
+    def decode(self, name: str, rows: Any) -> list:
+        """Values of a column for the given rows, as the pure-Python path has them"""
+        if name == DATE_COLUMN:
+            return self.dates[rows].astype(object).tolist()
+        values = numpy.array(self.vocabulary.values(name), dtype=object)
+        return values[self.codes[name][rows]].tolist()
@@ -0,0 +1,254 @@
+import atexit
+import csv
+import io
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+
+from speak_to_data.communication import locking
+
+# When a flushed batch counts as durable
+FSYNC_ALWAYS = "always"  # fsync after every row
+FSYNC_BATCH = "batch"  # fsync once per batch
+FSYNC_OS = "os"  # hand the batch to the OS and let it decide when to hit the disk
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_BATCH, FSYNC_OS)
+
+
+class WriterSettings(NamedTuple):
+    fsync_policy: str = FSYNC_BATCH
+    max_batch_rows: int = 256
+    max_batch_delay: float = 0.0
+    idle_timeout: Optional[float] = 30.0
+
+
+# Writers kept by get_writer; idle ones beyond this are forgotten
+MAX_WRITERS = 16
+
+_settings = WriterSettings()
+
+
+def configure(settings: WriterSettings) -> None:
+    """Set the policy for writers created from now on"""
+    global _settings
+    if settings.fsync_policy not in FSYNC_POLICIES:
+        raise ValueError(f"Unknown fsync policy {settings.fsync_policy!r}")
+    _settings = settings
+
+
+class _PendingRow:
+    __slots__ = ("line", "done", "error")
+
+    def __init__(self, line: bytes) -> None:
+        self.line = line
+        self.done = False
+        self.error: Optional[BaseException] = None
+
+
+class EventWriter:
+    """Appends CSV rows to one file through a handle that stays open
+
+    Rows are queued and written in batches by a background thread: whatever is
+    pending when the previous batch finishes goes out in the next one, optionally
+    waiting up to max_batch_delay seconds for the batch to fill up. write() only
+    returns once its row is durable under the fsync policy, and re-raises any
+    error hit while writing it. After idle_timeout seconds without rows the
+    thread ends and the file is closed; the next write starts them again.
+    """
+
+    def __init__(
+        self,
+        persistence_path: Path,
+        fieldnames: list[str],
+        fsync_policy: str = FSYNC_BATCH,
+        max_batch_rows: int = 256,
+        max_batch_delay: float = 0.0,
+        idle_timeout: Optional[float] = 30.0,
+    ) -> None:
+        self.persistence_path = persistence_path
+        self.fieldnames = fieldnames
+        self.fsync_policy = fsync_policy
+        self.max_batch_rows = max_batch_rows
+        self.max_batch_delay = max_batch_delay
+        self.idle_timeout = idle_timeout
+        self._condition = threading.Condition()
+        self._pending: list[_PendingRow] = []
+        self._last_queued: Optional[_PendingRow] = None
+        self._first_pending_at = 0.0
+        self._closed = False
+        self._handle: Optional[io.BufferedWriter] = None
+        self._flusher: Optional[threading.Thread] = None
+
+    def _encode(self, event_data: dict[str, str]) -> bytes:
+        line = io.StringIO()
+        w = csv.DictWriter(
+            line, fieldnames=self.fieldnames, dialect="unix", extrasaction="ignore"
+        )
+        w.writerow(event_data)
+        return line.getvalue().encode()
+
+    def write(self, event_data: dict[str, str]) -> None:
+        self.write_many((event_data,))
+
+    def write_many(self, events: Iterable[dict[str, str]]) -> None:
+        """Queue several rows and wait until all of them are durable"""
+        rows = [_PendingRow(self._encode(event_data)) for event_data in events]
+        if not rows:
+            return
+        with self._condition:
+            if self._closed:
+                raise ValueError(f"Writer for {self.persistence_path} is closed")
+            if not self._pending:
+                self._first_pending_at = time.monotonic()
+            self._pending.extend(rows)
+            self._last_queued = rows[-1]
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._run, name="event-writer", daemon=True
+                )
+                self._flusher.start()
+            self._condition.notify_all()
+            while not rows[-1].done:
+                self._condition.wait()
+        for row in rows:
+            if row.error:
+                raise row.error
+
+    def flush(self) -> None:
+        """Wait until every row queued so far is durable"""
+        with self._condition:
+            last = self._last_queued
+            while last and not last.done:
+                self._condition.wait()
+
+    @property
+    def idle(self) -> bool:
+        """Whether the background thread has ended and the file is closed"""
+        with self._condition:
+            return self._flusher is None
+
+    def close(self) -> None:
+        """Flush what is queued, stop the background thread and close the file"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            flusher = self._flusher
+        if flusher:
+            flusher.join()
+        self._close_handle()
+
+    def _close_handle(self) -> None:
+        if self._handle:
+            self._handle.close()
+            self._handle = None
+
+    def _next_batch(self) -> list[_PendingRow]:
+        with self._condition:
+            while not self._pending and not self._closed:
+                if not self._condition.wait(self.idle_timeout) and not self._pending:
+                    self._close_handle()
+                    self._flusher = None
+                    return []
+            while not self._closed and len(self._pending) < self.max_batch_rows:
+                deadline = self._first_pending_at + self.max_batch_delay
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending[: self.max_batch_rows]
+            del self._pending[: self.max_batch_rows]
+            self._first_pending_at = time.monotonic()
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            error: Optional[BaseException] = None
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                error = e
+            with self._condition:
+                for row in batch:
+                    row.error = error
+                    row.done = True
+                self._condition.notify_all()
+
+    def _open_handle(self) -> io.BufferedWriter:
+        """The open handle, reopened if the file was replaced since it was opened"""
+        try:
+            on_disk = os.stat(self.persistence_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"Trying to store the record at {self.persistence_path} "
+                f"but this is not a valid path."
+            )
+        if self._handle and os.fstat(self._handle.fileno()).st_ino != on_disk.st_ino:
+            self._handle.close()
+            self._handle = None
+        if not self._handle:
+            self._handle = open(self.persistence_path, "ab")
+        return self._handle
+
+    def _write_batch(self, batch: list[_PendingRow]) -> None:
+        """Append a batch under an exclusive lock on the file
+
+        Every writer opens the file in append mode, so each batch lands at the end
+        of the file; holding the lock keeps other processes from appending in the
+        middle of a batch that the OS splits into several writes, and keeps rows
+        from going to a file that compaction replaced while this writer waited.
+        """
+        while True:
+            handle = self._open_handle()
+            with locking.locked(handle, exclusive=True):
+                if not locking.is_current(handle, self.persistence_path):
+                    continue
+                if self.fsync_policy == FSYNC_ALWAYS:
+                    for row in batch:
+                        handle.write(row.line)
+                        handle.flush()
+                        os.fsync(handle.fileno())
+                    return
+                handle.write(b"".join(row.line for row in batch))
+                handle.flush()
+                if self.fsync_policy == FSYNC_BATCH:
+                    os.fsync(handle.fileno())
+                return
+
+
+_writers: dict[Path, EventWriter] = dict()
+_writers_lock = threading.Lock()
+
+
+def new_writer(persistence_path: Path, fieldnames: list[str]) -> EventWriter:
+    """A writer of the caller's own under the configured settings; close it after"""
+    return EventWriter(persistence_path, fieldnames, *_settings)
+
+
+def get_writer(persistence_path: Path, fieldnames: list[str]) -> EventWriter:
+    """Return the process-wide writer for a path, creating it on first use
+
+    Once more than MAX_WRITERS are kept, idle ones are forgotten. They hold no
+    thread or open file, so a caller still holding one can go on using it.
+    """
+    key = persistence_path.resolve()
+    with _writers_lock:
+        if key not in _writers:
+            if len(_writers) >= MAX_WRITERS:
+                for idle_key in [k for k, w in _writers.items() if w.idle]:
+                    del _writers[idle_key]
+            _writers[key] = new_writer(persistence_path, fieldnames)
+        return _writers[key]
+
+
+@atexit.register
+def close_all() -> None:
+    """Flush and close every writer; runs automatically at interpreter shutdown"""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
@@ -1,6 +1,6 @@
-from flask import Flask, redirect, render_template
+import click
+from flask import Flask, abort, jsonify, redirect, render_template
 from speak_to_data import application, presentation
-import time
 
 application.initial_setup()
 
@@ -11,31 +11,47 @@ app.config["SECRET_KEY"] = "hush"
 @app.route("/", methods=["GET", "POST"])
 def index():
     form = presentation.QueryForm()
+    job_id = None
     if form.validate_on_submit():
-        valid_query_data = application.QueryData(form.user_query.data)
-        if valid_query_data:
-            request_object = application.generate_request_object(
-                valid_query_data, application.config.EVENT_RECORDS_PATH
+        if application.query_jobs:
+            job_id = application.query_jobs.submit(
+                application.answer_query, form.user_query.data
+            )
+            response = (
+                "Working on it..."
+                if job_id
+                else "Too many questions are being answered. Please try again soon."
             )
-            response_from_model = application.call_tapas_on_hf(request_object)
-            response_to_user = application.Response(response_from_model)
-            while response_to_user.is_loading:
-                time.sleep(3)
-                response_from_model = application.call_tapas_on_hf(request_object)
-                response_to_user = application.Response(response_from_model)
-            response = str(response_to_user)
         else:
-            # Let the user know to change their query
-            response = valid_query_data.parsed_date.warning
+            response = application.answer_query(form.user_query.data)
     else:
         response = ""
     show_user = {
         "previous_query": form.user_query.data or "No query",
         "response": response,
+        "job_id": job_id,
     }
     return render_template("index.html", form=form, show_user=show_user)
 
 
+@app.route("/jobs/<job_id>")
+def query_job(job_id: str):
+    """State of a query job, with the response to show once it is done"""
+    status = application.query_jobs and application.query_jobs.status(job_id)
+    if not status:
+        abort(404)
+    response = status.result
+    if status.state == "failed":
+        response = "Something went wrong answering your query. Please try again."
+    return jsonify({"state": status.state, "response": response})
+
+
+@app.route("/stats")
+def stats():
+    """Response cache, shared model call and rate limiter figures of this process"""
+    return jsonify(application.runtime_stats())
+
+
 @app.route("/sow", methods=["GET", "POST"])
 def record_sow():
     return _sow_or_plant()
@@ -67,3 +83,42 @@ def record_maintain():
 def record_harvest():
     form = presentation.HarvestForm()
     return render_template("harvest.html", form=form)
+
+
+@app.cli.command("migrate-to-sqlite")
+def migrate_to_sqlite():
+    """Copy the CSV event records into the SQLite event store"""
+    migrated = application.migrate_csv_to_sqlite()
+    click.echo(
+        f"Migrated {migrated} events to {application.config.SQLITE_EVENT_RECORDS_PATH}"
+    )
+
+
+@app.cli.command("partition-events")
+def partition_events():
+    """Split the CSV event records into one file per month"""
+    copied = application.partition_csv_events()
+    click.echo(
+        f"Copied {copied} events to {application.config.PARTITIONED_EVENT_RECORDS_PATH}"
+    )
+
+
+@app.cli.command("compact-events")
+def compact_events():
+    """Fold the CSV event records into a binary snapshot plus an empty delta"""
+    try:
+        compacted = application.compact_events()
+    except ValueError as ve:
+        raise click.ClickException(str(ve))
+    click.echo(f"Compacted {compacted} events")
+
+
+@app.cli.command("answer-queries")
+@click.argument("queries", type=click.File())
+def answer_queries(queries):
+    """Answer a file of queries, one per line, with the model calls in flight together"""
+    user_queries = [line.strip() for line in queries if line.strip()]
+    for user_query, response in zip(
+        user_queries, application.answer_queries(user_queries)
+    ):
+        click.echo(f"{user_query}\t{response}")
@@ -1,15 +1,27 @@
 import unittest
 
+import asyncio
 import datetime
+import shutil
+import threading
+import time
 from pathlib import Path
+from types import SimpleNamespace
 
 from speak_to_data.application import (
+    aggregates,
     config,
     events,
+    jobs,
+    map_reduce,
     prepare_for_model,
     query_parser,
     response_parser,
+    retry,
+    single_flight,
+    table_budget,
 )
+from speak_to_data import application, communication
 from speak_to_data.communication import read_dataset
 import spacy
 
@@ -254,6 +266,107 @@ class TestDatasetFilter(unittest.TestCase):
         self.assertEqual(expected, actual)
 
 
+class TestFilterEngine(unittest.TestCase):
+    def setUp(self):
+        self.dataset = read_dataset(config.MOCK_DATA_LARGE)
+        # Only the attributes the filter engine reads, with a fixed date range
+        self.query_data = SimpleNamespace(
+            crops={"sprout"},
+            actions={"harvest"},
+            locations=set(),
+            columns={"crop", "action", "quantity"},
+            parsed_date=SimpleNamespace(
+                date_range=(datetime.date(2023, 1, 1), datetime.date(2023, 12, 31))
+            ),
+        )
+
+    def test_givenSeveralConstraints_thenMostSelectiveCheckRunsFirst(self):
+        checks = prepare_for_model.compile_checks(self.query_data, self.dataset)
+        pass_counts = [
+            sum(1 for row in self.dataset if check.test(row[check.key]))
+            for check in checks
+        ]
+        self.assertEqual("crop", checks[0].key)
+        self.assertEqual(min(pass_counts), pass_counts[0])
+
+    def test_givenQuery_thenTableMatchesRowByRowFilter(self):
+        start_date, end_date = self.query_data.parsed_date.date_range
+        matches = [
+            row
+            for row in self.dataset
+            if row["crop"] in self.query_data.crops
+            and row["action"] in self.query_data.actions
+            and start_date <= row["date"] <= end_date
+        ]
+        expected = {
+            key: [row[key] for row in matches] for key in ("action", "crop", "quantity")
+        }
+        actual = prepare_for_model.generate_model_ready_dataset(
+            self.dataset, self.query_data
+        )
+        self.assertEqual(expected, actual)
+
+    def test_givenNoMatchingRows_thenReturnEmptyDict(self):
+        self.query_data.crops = {"not-a-crop"}
+        actual = prepare_for_model.generate_model_ready_dataset(
+            self.dataset, self.query_data
+        )
+        self.assertEqual(dict(), actual)
+
+
+@unittest.skipUnless(communication.vectorised.AVAILABLE, "NumPy is not installed")
+class TestVectorisedFilterEngine(TestFilterEngine):
+    def setUp(self):
+        super().setUp()
+        self.event_columns = communication.read_columns(config.MOCK_DATA_LARGE)
+
+    def test_givenQuery_thenVectorisedTableMatchesPurePythonTable(self):
+        for crops in ({"sprout"}, {"sprout", "carrot"}, {"not-a-crop"}, set()):
+            with self.subTest(msg=f"Testing crops {crops}"):
+                self.query_data.crops = crops
+                expected = prepare_for_model.generate_model_ready_dataset(
+                    self.dataset, self.query_data
+                )
+                actual = prepare_for_model.generate_vectorised_dataset(
+                    self.event_columns, self.query_data
+                )
+                self.assertEqual(expected, actual)
+
+
+class TestQueryEngineFallback(unittest.TestCase):
+    def setUp(self):
+        self.query_engine = config.QUERY_ENGINE
+        self.numpy_available = communication.vectorised.AVAILABLE
+        config.QUERY_ENGINE = "numpy"
+
+    def tearDown(self):
+        config.QUERY_ENGINE = self.query_engine
+        communication.vectorised.AVAILABLE = self.numpy_available
+
+    def test_givenNumpyMissing_thenPurePythonPathIsUsed(self):
+        communication.vectorised.AVAILABLE = False
+        self.assertFalse(application.vectorised_queries())
+
+    def test_givenNumpyMissing_thenTableIsStillBuilt(self):
+        communication.vectorised.AVAILABLE = False
+        query_data = SimpleNamespace(
+            crops={"cress"},
+            actions={"sow"},
+            locations=set(),
+            columns={"crop", "action", "quantity"},
+            parsed_date=SimpleNamespace(
+                date_range=(datetime.date(2023, 1, 1), datetime.date(2023, 12, 31))
+            ),
+        )
+        expected = {
+            "action": ["sow", "sow"],
+            "crop": ["cress", "cress"],
+            "quantity": ["1sqft", "2sqft"],
+        }
+        actual = application.model_ready_dataset(query_data, config.MOCK_DATA_SMALL)
+        self.assertEqual(expected, actual)
+
+
 class TestModelResponse(unittest.TestCase):
     """Parse responses from TaPas model"""
 
@@ -291,3 +404,424 @@ class TestModelResponse(unittest.TestCase):
         expected = "SUM > 1sqft, 2sqft"
         actual = str(response_parser.Response(model_response))
         self.assertEqual(expected, actual)
+
+
+class TestLocalAggregates(unittest.TestCase):
+    def request_object(self, query: str, table: dict) -> dict:
+        return {"inputs": {"query": query, "table": table}}
+
+    def test_givenQuantitySumCrux_thenQuantitiesAreAddedUp(self):
+        table = {
+            "action": ["sow", "sow"],
+            "crop": ["cress", "cress"],
+            "quantity": ["1sqft", "2sqft"],
+        }
+        actual = aggregates.answer_locally(
+            self.request_object(query_parser.QUANTITY_SUM_CRUX, table)
+        )
+        self.assertEqual("3sqft", str(response_parser.Response(actual)))
+        self.assertEqual([[0, 2], [1, 2]], actual["coordinates"])
+        self.assertEqual("SUM", actual["aggregator"])
+
+    def test_givenDurationSumCrux_thenDurationsAreAddedUp(self):
+        table = {"action": ["maintain", "maintain"], "duration": ["30", "40"]}
+        actual = aggregates.answer_locally(
+            self.request_object(query_parser.DURATION_SUM_CRUX, table)
+        )
+        self.assertEqual("70", str(response_parser.Response(actual)))
+
+    def test_givenMixedUnits_thenEachUnitIsSummedSeparately(self):
+        table = {"quantity": ["600gr", "18 plants", "800gr", "2 plants"]}
+        actual = aggregates.answer_locally(
+            self.request_object(query_parser.QUANTITY_SUM_CRUX, table)
+        )
+        self.assertEqual("1400gr, 20 plants", actual["answer"])
+
+    def test_givenEmptyTable_thenResponseIsTableEmpty(self):
+        actual = aggregates.answer_locally(
+            self.request_object(query_parser.QUANTITY_SUM_CRUX, dict())
+        )
+        self.assertTrue(response_parser.Response(actual).table_empty)
+
+    def test_givenOtherQuestion_thenModelIsAsked(self):
+        queries_and_tables = [
+            ("which crop did I sow most?", {"crop": ["cress"]}),
+            (query_parser.QUANTITY_SUM_CRUX, {"quantity": ["a handful"]}),
+        ]
+        for query, table in queries_and_tables:
+            with self.subTest(msg=f"Testing query {query!r} on {table}"):
+                self.assertIsNone(
+                    aggregates.answer_locally(self.request_object(query, table))
+                )
+
+
+class TestTableBudget(unittest.TestCase):
+    def setUp(self):
+        self.table = {
+            "action": ["harvest", "harvest", "harvest", "harvest"],
+            "crop": ["sprout", "carrot", "sprout", "sprout"],
+            "quantity": ["600gr", "2kg", "800gr", "12 heads"],
+        }
+
+    def test_givenTableWithinBudget_thenTableIsUnchanged(self):
+        budget = table_budget.estimate_tokens(self.table)
+        actual = table_budget.fit_to_budget(self.table, budget)
+        self.assertIs(self.table, actual)
+
+    def test_givenTableOverBudget_thenRowsAreGroupedPerUnit(self):
+        expected = {
+            "action": ["harvest", "harvest", "harvest"],
+            "crop": ["sprout", "carrot", "sprout"],
+            "quantity": ["1400gr", "2kg", "12 heads"],
+        }
+        actual = table_budget.fit_to_budget(self.table, 1)
+        self.assertEqual(expected, actual)
+
+    def test_givenGroupedTable_thenSumAnswerIsUnchanged(self):
+        def answer(table):
+            return aggregates.answer_locally(
+                {"inputs": {"query": query_parser.QUANTITY_SUM_CRUX, "table": table}}
+            )["answer"]
+
+        grouped = table_budget.group_rows(self.table)
+        self.assertEqual(answer(self.table), answer(grouped))
+
+    def test_givenValuesWithoutNumber_thenOnlyEqualValuesAreGrouped(self):
+        table = {"crop": ["kale", "kale", "kale"], "quantity": ["a bag", "", "a bag"]}
+        expected = {"crop": ["kale", "kale"], "quantity": ["a bag", ""]}
+        self.assertEqual(expected, table_budget.group_rows(table))
+
+
+class TestChunkedModelCalls(unittest.TestCase):
+    def setUp(self):
+        self.table = {
+            "crop": ["sprout"] * 40,
+            "quantity": [f"{grams}gr" for grams in range(100, 500, 10)],
+        }
+        self.request_object = {
+            "inputs": {"query": query_parser.QUANTITY_SUM_CRUX, "table": self.table},
+            "options": {"wait_for_model": "True"},
+        }
+        self.calls = 0
+        self.running = 0
+        self.most_running = 0
+        self.lock = threading.Lock()
+
+    def fake_model(self, request_object: dict) -> dict:
+        """Answers a sum the way TaPas does, slowly enough to overlap"""
+        with self.lock:
+            self.calls += 1
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        cells = request_object["inputs"]["table"]["quantity"]
+        return {
+            "answer": f"SUM > {', '.join(cells)}",
+            "coordinates": [[row, 1] for row in range(len(cells))],
+            "cells": cells,
+            "aggregator": "SUM",
+        }
+
+    def test_givenChunks_thenEachFitsTheBudget(self):
+        chunks = map_reduce.split_table(self.table, 30)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(table_budget.estimate_tokens(chunk), 30)
+        self.assertEqual(
+            self.table["quantity"], sum((c["quantity"] for c in chunks), [])
+        )
+
+    def test_givenOversizedSumQuery_thenChunkAnswersAreCombined(self):
+        actual = map_reduce.call_in_chunks(self.request_object, self.fake_model, 30, 3)
+        self.assertGreater(self.calls, 1)
+        self.assertLessEqual(self.most_running, 3)
+        self.assertEqual(f"{sum(range(100, 500, 10))}gr", actual["answer"])
+        self.assertEqual([[row, 1] for row in range(40)], actual["coordinates"])
+
+    def test_givenTableWithinBudget_thenModelIsCalledOnce(self):
+        map_reduce.call_in_chunks(self.request_object, self.fake_model, 10_000, 3)
+        self.assertEqual(1, self.calls)
+
+    def test_givenChunkError_thenErrorIsReturned(self):
+        loading = {"error": "Model is currently loading", "estimated_time": 20.0}
+        actual = map_reduce.combine_answers([{"cells": []}, loading], [{}, {}])
+        self.assertIs(loading, actual)
+
+
+class TestAnswerRequest(unittest.TestCase):
+    def setUp(self):
+        self.response_cache = application.response_cache
+        application.response_cache = communication.ResponseCache(4, 60.0)
+
+    def tearDown(self):
+        application.response_cache = self.response_cache
+
+    def test_givenCachedModelAnswer_thenModelIsNotCalled(self):
+        table = {"crop": ["cress", "kale"]}
+        request_object = {"inputs": {"query": "which crops?", "table": table}}
+        answer = {"answer": "cress, kale", "aggregator": "NONE"}
+        key = communication.response_cache.cache_key("which crops?", table)
+        application.response_cache.put(key, answer)
+        self.assertEqual(answer, application.answer_request(request_object))
+        self.assertEqual(1, application.response_cache.stats().hits)
+
+
+class TestTableCache(unittest.TestCase):
+    def setUp(self):
+        secs_since_epoch = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        self.test_path = Path(f"./{secs_since_epoch}_test_table_cache.csv")
+        shutil.copy(config.MOCK_DATA_SMALL, self.test_path)
+        self.query_data = SimpleNamespace(
+            crops={"cress"},
+            actions={"sow"},
+            locations=set(),
+            columns={"crop", "quantity"},
+            parsed_date=SimpleNamespace(
+                date_range=(datetime.date(2023, 1, 1), datetime.date(2023, 12, 31))
+            ),
+        )
+
+    def tearDown(self):
+        self.test_path.unlink()
+
+    def test_givenUnchangedEvents_thenTableIsReused(self):
+        first = application.model_ready_dataset(self.query_data, self.test_path)
+        second = application.model_ready_dataset(self.query_data, self.test_path)
+        self.assertIs(first, second)
+
+    def test_givenNewEvent_thenTableIsRebuilt(self):
+        before = application.model_ready_dataset(self.query_data, self.test_path)
+        communication.persist_event(
+            {
+                "date": "2023-05-01",
+                "action": "sow",
+                "crop": "cress",
+                "quantity": "3sqft",
+            },
+            self.test_path,
+            config.FIELD_NAMES,
+        )
+        after = application.model_ready_dataset(self.query_data, self.test_path)
+        self.assertEqual(["1sqft", "2sqft"], before["quantity"])
+        self.assertEqual(["1sqft", "2sqft", "3sqft"], after["quantity"])
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.policy = retry.RetryPolicy(
+            initial_delay=1.0, max_delay=8.0, jitter=0.0, deadline=30.0
+        )
+        self.loading = {"error": "Model is currently loading", "estimated_time": 0.5}
+        self.answer = {"answer": "cress", "aggregator": "NONE"}
+
+    def answers(self, *model_responses):
+        remaining = list(model_responses)
+        return lambda request_object: remaining.pop(0)
+
+    def call(self, call_model, policy=None):
+        return retry.call_with_retries(
+            call_model,
+            {},
+            policy or self.policy,
+            clock=self.clock,
+            sleep=self.clock.sleep,
+        )
+
+    def test_givenLoadingModel_thenDelaysGrowExponentiallyUpToMax(self):
+        delays = [self.policy.delay(attempt) for attempt in range(6)]
+        self.assertEqual([1.0, 2.0, 4.0, 8.0, 8.0, 8.0], delays)
+
+    def test_givenJitter_thenDelayIsShortenedByUpToJitterFraction(self):
+        policy = self.policy._replace(jitter=0.5)
+        self.assertEqual(4.0, policy.delay(2, rng=lambda: 0.0))
+        self.assertEqual(2.0, policy.delay(2, rng=lambda: 1.0))
+
+    def test_givenEstimatedTime_thenDelayIsAtLeastEstimatedTime(self):
+        self.assertEqual(12.5, self.policy.delay(0, estimated_time=12.5))
+
+    def test_givenModelLoadsInTime_thenAnswerIsReturned(self):
+        call_model = self.answers(self.loading, self.loading, self.answer)
+        self.assertEqual(self.answer, self.call(call_model))
+        self.assertEqual([1.0, 2.0], self.clock.sleeps)
+
+    def test_givenOtherError_thenItIsReturnedWithoutRetrying(self):
+        table_empty = {"error": "table is empty"}
+        self.assertEqual(table_empty, self.call(self.answers(table_empty)))
+        self.assertEqual([], self.clock.sleeps)
+
+    def test_givenModelStillLoadingAtDeadline_thenWarmingUpIsReturned(self):
+        actual = self.call(lambda request_object: self.loading)
+        self.assertEqual(retry.WARMING_UP_ERROR, actual["error"])
+        self.assertEqual(retry.WARMING_UP_ERROR, str(application.Response(actual)))
+        self.assertLessEqual(self.clock.now, self.policy.deadline)
+
+    def test_givenEstimatedTimePastDeadline_thenNoRetryIsMade(self):
+        slow = {"error": "Model is currently loading", "estimated_time": 60.0}
+        actual = self.call(self.answers(slow))
+        self.assertEqual(retry.WARMING_UP_ERROR, actual["error"])
+        self.assertEqual(60.0, actual["estimated_time"])
+        self.assertEqual([], self.clock.sleeps)
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.job_queue = jobs.JobQueue(max_workers=2, max_jobs=2, max_pending=3)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def wait_until_finished(self, job_id):
+        while self.job_queue.status(job_id).state == "pending":
+            time.sleep(0.01)
+        return self.job_queue.status(job_id)
+
+    def test_givenSlowJob_thenSubmitReturnsBeforeItFinishes(self):
+        job_id = self.job_queue.submit(lambda: self.release.wait() and "done")
+        self.assertEqual(jobs.JobStatus("pending"), self.job_queue.status(job_id))
+        self.release.set()
+        self.assertEqual(
+            jobs.JobStatus("done", "done"), self.wait_until_finished(job_id)
+        )
+
+    def test_givenFailingJob_thenStatusIsFailed(self):
+        job_id = self.job_queue.submit(lambda: 1 / 0)
+        self.assertEqual(jobs.JobStatus("failed"), self.wait_until_finished(job_id))
+
+    def test_givenUnknownJob_thenStatusIsNone(self):
+        self.assertIsNone(self.job_queue.status("nope"))
+
+    def test_givenMoreJobsThanKept_thenOldestFinishedAreForgotten(self):
+        job_ids = [self.job_queue.submit(str, number) for number in range(2)]
+        for job_id in job_ids:
+            self.wait_until_finished(job_id)
+        pending = self.job_queue.submit(lambda: self.release.wait() and "done")
+        self.assertIsNone(self.job_queue.status(job_ids[0]))
+        self.assertEqual("1", self.job_queue.status(job_ids[1]).result)
+        self.assertEqual("pending", self.job_queue.status(pending).state)
+
+    def test_givenTooManyUnfinishedJobs_thenSubmitIsRefused(self):
+        job_ids = [
+            self.job_queue.submit(lambda: self.release.wait() and "done")
+            for _ in range(3)
+        ]
+        self.assertIsNone(self.job_queue.submit(str, 1))
+        self.release.set()
+        for job_id in job_ids:
+            self.wait_until_finished(job_id)
+        self.assertIsNotNone(self.job_queue.submit(str, 1))
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.single_flight = single_flight.SingleFlight()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def slow_call(self):
+        self.calls += 1
+        self.release.wait(5)
+        return {"answer": "cress"}
+
+    def call_from_threads(self, call, count=5):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(call()))
+            for _ in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        while self.single_flight.shared < count - 1:
+            time.sleep(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_givenConcurrentIdenticalCalls_thenOneCallIsShared(self):
+        results = self.call_from_threads(
+            lambda: self.single_flight.do("key", self.slow_call)
+        )
+        self.assertEqual(1, self.calls)
+        self.assertEqual([{"answer": "cress"}] * 5, results)
+
+    def test_givenFinishedCall_thenNextCallIsMadeAgain(self):
+        self.release.set()
+        self.single_flight.do("key", self.slow_call)
+        self.single_flight.do("key", self.slow_call)
+        self.assertEqual(2, self.calls)
+
+    def test_givenFailingCall_thenEveryWaiterGetsTheError(self):
+        def failing_call():
+            self.release.wait(5)
+            raise ConnectionError("model unreachable")
+
+        errors = []
+
+        def call():
+            try:
+                self.single_flight.do("key", failing_call)
+            except ConnectionError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while self.single_flight.shared < 2:
+            time.sleep(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(3, len(errors))
+
+    def test_givenConcurrentIdenticalCoroutines_thenOneCallIsShared(self):
+        async def slow_call():
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            return {"answer": "cress"}
+
+        async def call_together():
+            return await asyncio.gather(
+                *(self.single_flight.do_async("key", slow_call) for _ in range(5))
+            )
+
+        results = asyncio.run(call_together())
+        self.assertEqual(1, self.calls)
+        self.assertEqual([{"answer": "cress"}] * 5, results)
+
+    def test_givenIdenticalRequests_thenAnswerRequestCallsModelOnce(self):
+        response_cache = application.response_cache
+        call_tapas_on_hf = application.call_tapas_on_hf
+        model_calls = application.model_calls
+        application.response_cache = communication.ResponseCache(4, 60.0)
+        application.call_tapas_on_hf = lambda request_object: self.slow_call()
+        application.model_calls = self.single_flight
+        request_object = {
+            "inputs": {"query": "which crops?", "table": {"crop": ["cress"]}}
+        }
+        try:
+            results = self.call_from_threads(
+                lambda: application.answer_request(request_object)
+            )
+        finally:
+            application.response_cache = response_cache
+            application.call_tapas_on_hf = call_tapas_on_hf
+            application.model_calls = model_calls
+        self.assertEqual(1, self.calls)
+        self.assertEqual([{"answer": "cress"}] * 5, results)
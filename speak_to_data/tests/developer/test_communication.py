@@ -1,9 +1,24 @@
+import asyncio
 import csv
 import datetime
+import errno
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from unittest import mock
 from speak_to_data import application, communication
 import unittest
 
+try:
+    import numpy
+except ImportError:  # Tests needing it are skipped
+    numpy = None  # type: ignore[assignment]
 
 # Create test files
 fieldnames = [
@@ -92,3 +107,1154 @@ class TestDatasetReader(unittest.TestCase):
             row["date"] = datetime.date.fromisoformat(row["date"])
         actual = communication.persistence.read_dataset(mock_data_path)
         self.assertEqual(expected, actual)
+
+
+class TestEventStore(unittest.TestCase):
+    def setUp(self):
+        secs_since_epoch = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        self.test_path = Path(f"./{secs_since_epoch}_test_event_store.csv")
+        with open(self.test_path, "w", newline="") as tp:
+            w = csv.DictWriter(tp, fieldnames=fieldnames, dialect="unix")
+            w.writeheader()
+            w.writerow(mock_data[0])
+        self.store = communication.EventStore(self.test_path)
+
+    def tearDown(self):
+        self.test_path.unlink()
+
+    def test_givenUnchangedFile_thenColumnsAreNotParsedAgain(self):
+        first = self.store.columns()
+        second = self.store.columns()
+        self.assertIs(first, second)
+
+    def test_givenAppendedEvent_thenStoreReloadsColumns(self):
+        self.store.columns()
+        with open(self.test_path, "a", newline="") as tp:
+            w = csv.DictWriter(tp, fieldnames=fieldnames, dialect="unix")
+            w.writerow(mock_data[1])
+        expected = ["1sqft", "2sqft"]
+        actual = self.store.columns().decode("quantity")
+        self.assertEqual(expected, actual)
+
+    def test_givenColumns_thenRowsMatchCsvDictReader(self):
+        with open(self.test_path, newline="") as tp:
+            expected = list(csv.DictReader(tp, dialect="unix"))
+        for row in expected:
+            row["date"] = datetime.date.fromisoformat(row["date"])
+        actual = self.store.rows()
+        self.assertEqual(expected, actual)
+
+    def test_givenRepeatedValues_thenColumnsHoldOneCodePerRow(self):
+        with open(self.test_path, "a", newline="") as tp:
+            w = csv.DictWriter(tp, fieldnames=fieldnames, dialect="unix")
+            w.writerows(mock_data)
+        columns = self.store.columns()
+        crop_codes = columns.columns["crop"]
+        self.assertEqual("H", crop_codes.typecode)
+        self.assertEqual(crop_codes[0], crop_codes[1])
+        self.assertEqual(["", "cress"], sorted(set(columns.decode("crop"))))
+
+    def test_givenRowView_thenFieldsAreDecodedOnAccess(self):
+        row = self.store.columns().row(0)
+        self.assertEqual(datetime.date(2023, 4, 28), row["date"])
+        self.assertEqual("kitchen", row["location"])
+        self.assertEqual(self.store.rows()[0], row.as_dict())
+
+    def test_givenAppendedEvent_thenExistingColumnsAreExtendedInPlace(self):
+        crops_before = self.store.columns().columns["crop"]
+        with open(self.test_path, "a", newline="") as tp:
+            w = csv.DictWriter(tp, fieldnames=fieldnames, dialect="unix")
+            w.writerow(mock_data[2])
+        crops_after = self.store.columns().columns["crop"]
+        self.assertIs(crops_before, crops_after)
+        self.assertEqual(["cress", ""], self.store.columns().decode("crop"))
+
+    def test_givenRewrittenFile_thenStoreFallsBackToFullReload(self):
+        self.store.columns()
+        with open(self.test_path, "w", newline="") as tp:
+            w = csv.DictWriter(tp, fieldnames=fieldnames, dialect="unix")
+            w.writeheader()
+            w.writerows(mock_data[2:])
+        expected = ["30", "40"]
+        actual = self.store.columns().decode("duration")
+        self.assertEqual(expected, actual)
+
+    def test_givenSameSizeRewriteInPlace_thenStoreFallsBackToFullReload(self):
+        with open(self.test_path, "a", newline="") as tp:
+            w = csv.DictWriter(tp, fieldnames=fieldnames, dialect="unix")
+            w.writerows(mock_data[1:])
+        self.assertEqual("2sqft", self.store.rows()[1]["quantity"])
+        with open(self.test_path, "r+b") as tp:
+            content = tp.read()
+            tp.seek(content.index(b"2sqft"))
+            tp.write(b"7sqft")
+        stat = os.stat(self.test_path)
+        os.utime(self.test_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        self.assertEqual("7sqft", self.store.rows()[1]["quantity"])
+
+    def test_givenPartialTrailingLine_thenRowIsNotReadUntilComplete(self):
+        with open(self.test_path, "a") as tp:
+            tp.write('"2023-04-29","sow","cress"')
+        self.assertEqual(1, len(self.store.rows()))
+        with open(self.test_path, "a") as tp:
+            tp.write(',"2sqft","","kitchen","indoor-window-box"\n')
+        self.assertEqual(2, len(self.store.rows()))
+
+
+class TestSqliteStore(unittest.TestCase):
+    def setUp(self):
+        secs_since_epoch = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        self.test_path = Path(f"./{secs_since_epoch}_test_events.sqlite3")
+        communication.sqlite_store.migrate_from_csv(
+            application.config.MOCK_DATA_SMALL, self.test_path, fieldnames
+        )
+
+    def tearDown(self):
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{self.test_path}{suffix}").unlink(missing_ok=True)
+
+    def test_givenMigratedCsv_thenDatasetMatchesCsvDataset(self):
+        expected = communication.read_dataset(application.config.MOCK_DATA_SMALL)
+        actual = communication.sqlite_store.read_dataset(self.test_path)
+        self.assertEqual(expected, actual)
+
+    def test_givenMigrationRunTwice_thenEventsAreNotDuplicated(self):
+        migrated = communication.sqlite_store.migrate_from_csv(
+            application.config.MOCK_DATA_SMALL, self.test_path, fieldnames
+        )
+        self.assertEqual(0, migrated)
+        self.assertEqual(
+            4, len(communication.sqlite_store.read_dataset(self.test_path))
+        )
+
+    def test_givenEventFilter_thenOnlyMatchingEventsAreRead(self):
+        event_filter = communication.EventFilter(
+            locations={"kitchen"},
+            start_date=datetime.date(2023, 4, 29),
+            end_date=datetime.date(2023, 5, 31),
+        )
+        expected = ["2sqft", ""]
+        actual = [
+            row["quantity"]
+            for row in communication.sqlite_store.read_dataset(
+                self.test_path, event_filter
+            )
+        ]
+        self.assertEqual(expected, actual)
+
+    def test_givenPersistedEvent_thenEventIsReadBack(self):
+        communication.sqlite_store.persist_event(
+            {"date": "2023-06-01", "action": "harvest", "crop": "cress"},
+            self.test_path,
+            fieldnames,
+        )
+        event_filter = communication.EventFilter(actions={"harvest"})
+        actual = communication.sqlite_store.read_dataset(self.test_path, event_filter)
+        self.assertEqual(datetime.date(2023, 6, 1), actual[0]["date"])
+        self.assertEqual("", actual[0]["duration"])
+
+    def test_givenPersistedEvent_thenGenerationGoesUp(self):
+        before = communication.sqlite_store.data_generation(self.test_path)
+        communication.sqlite_store.persist_event(
+            mock_data[0], self.test_path, fieldnames
+        )
+        after = communication.sqlite_store.data_generation(self.test_path)
+        self.assertGreater(after, before)
+
+
+class TestEventWriter(unittest.TestCase):
+    def setUp(self):
+        secs_since_epoch = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        self.test_path = Path(f"./{secs_since_epoch}_test_writer.csv")
+        self.test_path.touch()
+        self.writer = communication.writer.EventWriter(self.test_path, fieldnames)
+
+    def tearDown(self):
+        self.writer.close()
+        self.test_path.unlink()
+
+    def _written_lines(self) -> list[str]:
+        with open(self.test_path) as tp:
+            return tp.read().splitlines()
+
+    def test_givenWrite_thenRowIsOnDiskWhenWriteReturns(self):
+        self.writer.write(mock_data[0])
+        expected = [
+            '"2023-04-28","sow","cress","1sqft","","kitchen","indoor-window-box"'
+        ]
+        actual = self._written_lines()
+        self.assertEqual(expected, actual)
+
+    def test_givenConcurrentWriters_thenEveryRowIsWrittenWhole(self):
+        threads = [
+            threading.Thread(target=self.writer.write_many, args=(mock_data * 25,))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        lines = self._written_lines()
+        self.assertEqual(8 * 25 * len(mock_data), len(lines))
+        self.assertTrue(all(line.count('","') == 6 for line in lines))
+
+    def test_givenDeletedFile_thenWriteRaisesFileNotFound(self):
+        self.writer.write(mock_data[0])
+        self.test_path.unlink()
+        with self.assertRaises(FileNotFoundError):
+            self.writer.write(mock_data[1])
+        self.test_path.touch()
+
+    def test_givenClosedWriter_thenQueuedRowsWereFlushed(self):
+        self.writer.write_many(mock_data)
+        self.writer.close()
+        self.assertEqual(len(mock_data), len(self._written_lines()))
+
+    def test_givenIdleWriter_thenThreadEndsAndNextWriteRestartsIt(self):
+        writer = communication.writer.EventWriter(
+            self.test_path, fieldnames, idle_timeout=0.05
+        )
+        self.addCleanup(writer.close)
+        writer.write(mock_data[0])
+        _wait_until(lambda: writer.idle)
+        self.assertIsNone(writer._handle)
+        writer.write(mock_data[1])
+        self.assertEqual(2, len(self._written_lines()))
+
+
+def _wait_until(condition, timeout=5.0):
+    give_up_at = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > give_up_at:
+            raise AssertionError("Condition not met in time")
+        time.sleep(0.01)
+
+
+def _append_from_worker_process(path_name: str, repeats: int) -> None:
+    worker = communication.writer.EventWriter(Path(path_name), fieldnames)
+    worker.write_many(mock_data * repeats)
+    worker.close()
+
+
+class TestCrossProcessAppends(unittest.TestCase):
+    def setUp(self):
+        secs_since_epoch = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        self.test_path = Path(f"./{secs_since_epoch}_test_processes.csv")
+
+    def tearDown(self):
+        self.test_path.unlink(missing_ok=True)
+
+    def test_givenConcurrentInitialSetup_thenHeaderIsWrittenOnce(self):
+        threads = [
+            threading.Thread(
+                target=communication.persistence.initialise_store,
+                args=(self.test_path, fieldnames),
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with open(self.test_path) as tp:
+            self.assertEqual(1, len(tp.readlines()))
+
+    def test_givenNoHardLinks_thenHeaderIsStillWrittenOnce(self):
+        unsupported = OSError(errno.EPERM, "Operation not permitted")
+        with mock.patch.object(os, "link", side_effect=unsupported):
+            threads = [
+                threading.Thread(
+                    target=communication.persistence.initialise_store,
+                    args=(self.test_path, fieldnames),
+                )
+                for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        with open(self.test_path) as tp:
+            header = ",".join(f'"{name}"' for name in fieldnames)
+            self.assertEqual([header + "\n"], tp.readlines())
+
+    def test_givenWorkerProcesses_thenRowsDoNotInterleave(self):
+        communication.persistence.initialise_store(self.test_path, fieldnames)
+        workers = [
+            multiprocessing.Process(
+                target=_append_from_worker_process, args=(str(self.test_path), 50)
+            )
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        dataset = communication.EventStore(self.test_path).rows()
+        self.assertEqual(4 * 50 * len(mock_data), len(dataset))
+        self.assertTrue(all(row["location_type"] for row in dataset))
+
+
+class TestPartitionedStore(unittest.TestCase):
+    def setUp(self):
+        secs_since_epoch = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        self.test_dir = Path(f"./{secs_since_epoch}_test_partitions")
+        communication.partitions.split_into_partitions(
+            application.config.MOCK_DATA_LARGE, self.test_dir, fieldnames
+        )
+
+    def tearDown(self):
+        communication.writer.close_all()
+        shutil.rmtree(self.test_dir)
+
+    def test_givenSplitCsv_thenOneFilePerMonth(self):
+        expected = {
+            "2023-04.csv",
+            "2023-05.csv",
+            "2023-09.csv",
+            "2023-10.csv",
+            "2023-11.csv",
+            "2023-12.csv",
+        }
+        actual = set(path.name for path in self.test_dir.iterdir())
+        self.assertEqual(expected, actual)
+
+    def test_givenDateFilter_thenGenerationOnlyOpensPartitionsInRange(self):
+        month_dir = self.test_dir / "months"
+        communication.partitions.initialise_store(month_dir, fieldnames)
+        for month in range(1, 13):
+            event = {**mock_data[0], "date": f"2023-{month:02d}-10"}
+            communication.partitions.persist_event(event, month_dir, fieldnames)
+        one_week = communication.EventFilter(
+            start_date=datetime.date(2023, 6, 5), end_date=datetime.date(2023, 6, 11)
+        )
+        generation = communication.partitions.data_generation(month_dir, one_week)
+        opened = [
+            path
+            for path in communication.event_store._stores
+            if path.parent == month_dir.resolve()
+        ]
+        self.assertEqual([month_dir.resolve() / "2023-06.csv"], opened)
+        communication.partitions.persist_event(
+            {**mock_data[0], "date": "2023-06-20"}, month_dir, fieldnames
+        )
+        after = communication.partitions.data_generation(month_dir, one_week)
+        self.assertGreater(after, generation)
+
+    def test_givenSplitCsv_thenNoWriterIsKeptForThePartitions(self):
+        kept = [
+            path
+            for path in communication.writer._writers
+            if path.parent == self.test_dir.resolve()
+        ]
+        self.assertEqual([], kept)
+
+    def test_givenManyMonthsWritten_thenIdleWritersAreReleased(self):
+        settings = communication.writer._settings
+        self.addCleanup(communication.writer.configure, settings)
+        communication.writer.configure(settings._replace(idle_timeout=0.05))
+        month_dir = self.test_dir / "months"
+        communication.partitions.initialise_store(month_dir, fieldnames)
+        with mock.patch.object(communication.writer, "MAX_WRITERS", 2):
+            for month in range(1, 7):
+                event = {**mock_data[0], "date": f"2023-{month:02d}-10"}
+                communication.partitions.persist_event(event, month_dir, fieldnames)
+                writers = [
+                    writer
+                    for path, writer in communication.writer._writers.items()
+                    if path.parent == month_dir.resolve()
+                ]
+                self.assertLessEqual(len(writers), 2)
+                _wait_until(lambda: all(writer.idle for writer in writers))
+
+    def test_givenSplitCsv_thenEveryEventIsRead(self):
+        expected = communication.read_dataset(application.config.MOCK_DATA_LARGE)
+        actual = communication.partitions.read_dataset(self.test_dir)
+        self.assertEqual(
+            sorted(expected, key=lambda row: row["date"]),
+            sorted(actual, key=lambda row: row["date"]),
+        )
+
+    def test_givenDateRange_thenOnlyEventsInRangeAreRead(self):
+        event_filter = communication.EventFilter(
+            start_date=datetime.date(2023, 9, 25),
+            end_date=datetime.date(2023, 10, 1),
+        )
+        expected = [datetime.date(2023, 9, 26), datetime.date(2023, 9, 29)]
+        actual = [
+            row["date"]
+            for row in communication.partitions.read_dataset(
+                self.test_dir, event_filter
+            )
+        ]
+        self.assertEqual(expected, actual)
+
+    def test_givenPersistedEvent_thenEventLandsInItsMonth(self):
+        communication.partitions.persist_event(
+            {"date": "2024-02-29", "action": "maintain", "duration": "20"},
+            self.test_dir,
+            fieldnames,
+        )
+        partition = self.test_dir / "2024-02.csv"
+        self.assertEqual(1, len(communication.read_dataset(partition)))
+
+
+class TestSnapshotCompaction(unittest.TestCase):
+    def setUp(self):
+        secs_since_epoch = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        self.test_path = Path(f"./{secs_since_epoch}_test_compaction.csv")
+        shutil.copy(application.config.MOCK_DATA_LARGE, self.test_path)
+        self.expected = communication.EventStore(self.test_path).rows()
+
+    def tearDown(self):
+        self.test_path.unlink()
+        communication.snapshot.snapshot_path(self.test_path).unlink(missing_ok=True)
+
+    def test_givenCompactedStore_thenCsvHoldsOnlyHeader(self):
+        communication.persistence.compact(self.test_path)
+        with open(self.test_path) as tp:
+            self.assertEqual(1, len(tp.readlines()))
+
+    def test_givenCompactedStore_thenNewStoreReadsSameEvents(self):
+        compacted = communication.persistence.compact(self.test_path)
+        self.assertEqual(len(self.expected), compacted)
+        actual = communication.EventStore(self.test_path).rows()
+        self.assertEqual(self.expected, actual)
+
+    def test_givenEventsAfterCompaction_thenSnapshotAndDeltaAreCombined(self):
+        store = communication.EventStore(self.test_path)
+        store.compact()
+        event_writer = communication.writer.EventWriter(self.test_path, fieldnames)
+        event_writer.write(mock_data[3])
+        event_writer.close()
+        for reader in (store, communication.EventStore(self.test_path)):
+            with self.subTest(msg=f"Reading through {reader}"):
+                rows = reader.rows()
+                self.assertEqual(self.expected, rows[:-1])
+                self.assertEqual("east-hoop-house", rows[-1]["location"])
+
+    def test_givenFailedTruncation_thenEventsAreNotCountedTwice(self):
+        failure = OSError(errno.EIO, "Input/output error")
+        store = communication.EventStore(self.test_path)
+        with mock.patch.object(store, "_truncate_to_header", side_effect=failure):
+            with self.assertRaises(OSError):
+                store.compact()
+        self.assertTrue(communication.snapshot.snapshot_path(self.test_path).exists())
+        fresh = communication.EventStore(self.test_path)
+        self.assertEqual(self.expected, fresh.rows())
+        streamed = list(communication.iter_dataset(self.test_path))
+        self.assertEqual(self.expected, streamed)
+
+        event_writer = communication.writer.EventWriter(self.test_path, fieldnames)
+        event_writer.write(mock_data[3])
+        event_writer.close()
+        for reader in (fresh, communication.EventStore(self.test_path)):
+            with self.subTest(msg=f"Reading through {reader}"):
+                rows = reader.rows()
+                self.assertEqual(self.expected, rows[:-1])
+                self.assertEqual("east-hoop-house", rows[-1]["location"])
+        self.assertEqual(len(self.expected) + 1, fresh.compact())
+        self.assertEqual(fresh.rows(), communication.EventStore(self.test_path).rows())
+
+    def test_givenSnapshot_thenColumnsRoundTrip(self):
+        columns = communication.EventStore(self.test_path).columns()
+        path = communication.snapshot.snapshot_path(self.test_path)
+        communication.snapshot.write_snapshot(
+            path,
+            communication.snapshot.Snapshot(
+                columns.columns, columns.vocabulary.as_dict(), columns.row_count
+            ),
+        )
+        actual = communication.snapshot.read_snapshot(path)
+        self.assertEqual(columns.columns, actual.columns)
+        self.assertEqual(columns.vocabulary.as_dict(), actual.vocabulary)
+
+
+class TestFilterPushdown(unittest.TestCase):
+    def setUp(self):
+        secs_since_epoch = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        self.test_path = Path(f"./{secs_since_epoch}_test_pushdown.csv")
+        shutil.copy(application.config.MOCK_DATA_LARGE, self.test_path)
+        self.event_filter = communication.EventFilter(
+            actions=frozenset({"harvest"}),
+            start_date=datetime.date(2023, 1, 1),
+            end_date=datetime.date(2023, 12, 31),
+        )
+        self.expected = [
+            row
+            for row in communication.EventStore(self.test_path).rows()
+            if self.event_filter.matches(row)
+        ]
+
+    def tearDown(self):
+        self.test_path.unlink()
+        communication.snapshot.snapshot_path(self.test_path).unlink(missing_ok=True)
+
+    def test_givenEventFilter_thenReadDatasetReturnsOnlyMatches(self):
+        actual = communication.read_dataset(self.test_path, self.event_filter)
+        self.assertEqual(self.expected, actual)
+
+    def test_givenEventFilter_thenIterDatasetStreamsSameEvents(self):
+        stream = communication.iter_dataset(self.test_path, self.event_filter)
+        self.assertNotIsInstance(stream, list)
+        self.assertEqual(self.expected, list(stream))
+
+    def test_givenNoFilter_thenIterDatasetReturnsEveryEvent(self):
+        expected = communication.EventStore(self.test_path).rows()
+        self.assertEqual(expected, list(communication.iter_dataset(self.test_path)))
+
+    def test_givenCompactedStore_thenIterDatasetReadsSnapshotAndDelta(self):
+        communication.persistence.compact(self.test_path)
+        event_writer = communication.writer.EventWriter(self.test_path, fieldnames)
+        event_writer.write({**mock_data[0], "action": "harvest"})
+        event_writer.close()
+        actual = list(communication.iter_dataset(self.test_path, self.event_filter))
+        self.assertEqual(self.expected, actual[:-1])
+        self.assertEqual("cress", actual[-1]["crop"])
+
+    def test_givenPostingIndex_thenSelectMatchesFullScan(self):
+        columns = communication.EventStore(self.test_path).columns()
+        event_filter = self.event_filter._replace(
+            crops=frozenset({"sprout", "carrot"}), locations=frozenset({"pig-patch"})
+        )
+        expected = list(columns._replace(postings=None).select(event_filter))
+        self.assertEqual(expected, list(columns.select(event_filter)))
+
+    def test_givenAppendedEvent_thenPostingListsIncludeNewRow(self):
+        store = communication.EventStore(self.test_path)
+        list(store.columns().select(self.event_filter))
+        event_writer = communication.writer.EventWriter(self.test_path, fieldnames)
+        event_writer.write({**mock_data[0], "action": "harvest"})
+        event_writer.close()
+        columns = store.columns()
+        self.assertEqual(
+            columns.row_count - 1, list(columns.select(self.event_filter))[-1]
+        )
+
+    def test_givenUnknownValue_thenPostingLookupIsEmpty(self):
+        columns = communication.EventStore(self.test_path).columns()
+        event_filter = communication.EventFilter(crops=frozenset({"not-a-crop"}))
+        self.assertEqual([], list(columns.select(event_filter)))
+
+
+class TestFilterOnEmptyStore(unittest.TestCase):
+    def setUp(self):
+        secs_since_epoch = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        self.test_path = Path(f"./{secs_since_epoch}_test_empty_store.csv")
+        self.event_filter = communication.EventFilter(
+            crops=frozenset({"cress"}),
+            start_date=datetime.date(2023, 1, 1),
+            end_date=datetime.date(2023, 12, 31),
+        )
+
+    def tearDown(self):
+        self.test_path.unlink()
+
+    def test_givenEmptyFile_thenFilteredReadsReturnNothing(self):
+        self.test_path.touch()
+        self.assertEqual(
+            [], communication.read_dataset(self.test_path, self.event_filter)
+        )
+        self.assertEqual(
+            [], list(communication.iter_dataset(self.test_path, self.event_filter))
+        )
+
+    def test_givenHeaderlessFile_thenFilteredReadReturnsNothing(self):
+        with open(self.test_path, "w") as tp:
+            tp.write('"2023-04-28","sow","cress","1sqft","","kitchen","indoor"\n')
+        self.assertEqual(
+            [], communication.read_dataset(self.test_path, self.event_filter)
+        )
+
+    @unittest.skipUnless(communication.vectorised.AVAILABLE, "NumPy is not installed")
+    def test_givenHeaderlessFile_thenVectorisedMaskMatchesNothing(self):
+        with open(self.test_path, "w") as tp:
+            tp.write('"2023-04-28","sow","cress","1sqft","","kitchen","indoor"\n')
+            tp.write('"2023-04-29","sow","cress","2sqft","","kitchen","indoor"\n')
+        vectorised = communication.vectorised.VectorisedColumns.from_columns(
+            communication.read_columns(self.test_path)
+        )
+        self.assertEqual(0, len(vectorised.select(self.event_filter)))
+
+    def test_givenNoConstraints_thenFilterIsFalsy(self):
+        self.test_path.touch()
+        self.assertFalse(communication.EventFilter())
+        self.assertFalse(
+            communication.EventFilter(start_date=datetime.date(2023, 1, 1))
+        )
+        self.assertTrue(self.event_filter)
+
+
+class TestDateIndex(unittest.TestCase):
+    def setUp(self):
+        self.dates = array("i", (day // 3 for day in range(300)))
+        self.index = communication.indexes.DateIndex(self.dates)
+
+    def expected(self, start, end):
+        return [row for row, date in enumerate(self.dates) if start <= date <= end]
+
+    def test_givenDatesInOrder_thenRangeIsOneSpan(self):
+        actual = self.index.rows_between(10, 19, len(self.dates))
+        self.assertEqual(self.expected(10, 19), list(actual))
+
+    def test_givenOutOfOrderRows_thenRangeStillIncludesThem(self):
+        self.index.rows_between(0, 0, len(self.dates))
+        self.dates.extend((15, 500, 12))
+        self.index.extend(len(self.dates))
+        actual = self.index.rows_between(10, 19, len(self.dates))
+        self.assertEqual(self.expected(10, 19), list(actual))
+
+    def test_givenFullOverflow_thenRowsAreMergedInRecordedOrder(self):
+        self.dates.extend([50] * communication.indexes.DATE_OVERFLOW_LIMIT)
+        actual = self.index.rows_between(49, 50, len(self.dates))
+        self.assertEqual(self.expected(49, 50), list(actual))
+
+    def test_givenOlderRowCount_thenNewerRowsAreLeftOut(self):
+        row_count = len(self.dates)
+        self.index.rows_between(0, 0, row_count)
+        self.dates.append(99)
+        self.index.extend(len(self.dates))
+        actual = self.index.rows_between(0, 1000, row_count)
+        self.assertEqual(list(range(row_count)), list(actual))
+
+
+@unittest.skipUnless(communication.vectorised.AVAILABLE, "NumPy is not installed")
+class TestVectorisedColumns(unittest.TestCase):
+    def setUp(self):
+        self.event_columns = communication.read_columns(
+            application.config.MOCK_DATA_LARGE
+        )
+        self.vectorised = communication.vectorised.VectorisedColumns.from_columns(
+            self.event_columns
+        )
+
+    def test_givenEventFilter_thenMaskSelectsSameRowsAsIndexes(self):
+        event_filter = communication.EventFilter(
+            actions=frozenset({"harvest"}),
+            start_date=datetime.date(2023, 1, 1),
+            end_date=datetime.date(2023, 12, 31),
+        )
+        expected = list(self.event_columns.select(event_filter))
+        self.assertEqual(expected, self.vectorised.select(event_filter).tolist())
+
+    def test_givenDates_thenDecodedLikeEventStore(self):
+        rows = self.vectorised.select(None)
+        self.assertEqual(
+            self.event_columns.decode("date"), self.vectorised.decode("date", rows)
+        )
+
+    def test_givenSameStore_thenArraysAreNotCopiedAgain(self):
+        again = communication.vectorised.VectorisedColumns.from_columns(
+            communication.read_columns(application.config.MOCK_DATA_LARGE)
+        )
+        self.assertTrue(numpy.shares_memory(self.vectorised.dates, again.dates))
+        self.assertTrue(
+            numpy.shares_memory(self.vectorised.codes["crop"], again.codes["crop"])
+        )
+
+    def test_givenAppendedEvents_thenArraysAreExtended(self):
+        secs_since_epoch = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        test_path = Path(f"./{secs_since_epoch}_test_vectorised.csv")
+        shutil.copy(application.config.MOCK_DATA_LARGE, test_path)
+        self.addCleanup(test_path.unlink)
+        before = communication.vectorised.VectorisedColumns.from_columns(
+            communication.read_columns(test_path)
+        )
+        event_writer = communication.writer.EventWriter(test_path, fieldnames)
+        event_writer.write_many(mock_data * 3)
+        event_writer.close()
+        event_columns = communication.read_columns(test_path)
+        after = communication.vectorised.VectorisedColumns.from_columns(event_columns)
+        self.assertEqual(before.row_count + 3 * len(mock_data), after.row_count)
+        self.assertIs(
+            communication.read_columns(test_path).derived["numpy"],
+            event_columns.derived["numpy"],
+        )
+        rows = after.select(None)
+        for name in fieldnames:
+            with self.subTest(msg=f"Column {name}"):
+                self.assertEqual(event_columns.decode(name), after.decode(name, rows))
+
+
+def _unlimited():
+    return communication.network.RateLimiter(1e6, 1_000_000, 0, 0.0)
+
+
+class _StandInModel(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    delay = 0.0
+    clients: list = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        _StandInModel.clients.append(self.client_address)
+        time.sleep(_StandInModel.delay)
+        body = json.dumps({"answer": "SUM > 1sqft"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestTapasInterface(unittest.TestCase):
+    def setUp(self):
+        _StandInModel.delay = 0.0
+        _StandInModel.clients = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInModel)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/model"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_givenSeveralInterfaces_thenTheyShareOneSession(self):
+        first = communication.TapasInterface("token", full_url=self.url)
+        second = communication.TapasInterface("token", full_url=self.url)
+        self.assertIs(first.session, second.session)
+
+    def test_givenRepeatedCalls_thenConnectionIsKeptAlive(self):
+        tapas_interface = communication.TapasInterface(
+            "token", full_url=self.url, rate_limiter=_unlimited()
+        )
+        for _ in range(3):
+            self.assertEqual(
+                "SUM > 1sqft", tapas_interface.call_model_api({})["answer"]
+            )
+        self.assertEqual(1, len(set(_StandInModel.clients)))
+
+    def test_givenSlowModel_thenCallTimesOutWithError(self):
+        _StandInModel.delay = 0.5
+        tapas_interface = communication.TapasInterface(
+            "token",
+            timeout=(1.0, 0.1),
+            full_url=self.url,
+            breaker=communication.network.CircuitBreaker(),
+            rate_limiter=_unlimited(),
+        )
+        actual = application.Response(tapas_interface.call_model_api({}))
+        self.assertIn("did not answer in time", str(actual))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        _StandInModel.delay = 0.0
+        _StandInModel.clients = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInModel)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.now = 0.0
+        self.breaker = communication.network.CircuitBreaker(
+            failure_threshold=2,
+            slow_call=0.2,
+            reset_timeout=30.0,
+            clock=lambda: self.now,
+        )
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def tapas_interface(self, url=None, **kwargs):
+        kwargs.setdefault("timeout", (1.0, 0.1))
+        return communication.TapasInterface(
+            "token",
+            full_url=url or f"http://127.0.0.1:{self.port}/model",
+            breaker=self.breaker,
+            rate_limiter=_unlimited(),
+            **kwargs,
+        )
+
+    def test_givenRepeatedFailures_thenCircuitOpensAndFailsFast(self):
+        tapas_interface = self.tapas_interface(url="http://127.0.0.1:1/model")
+        for _ in range(2):
+            actual = tapas_interface.call_model_api({})
+            self.assertEqual(communication.network.UNREACHABLE_ERROR, actual["error"])
+        self.assertEqual("open", self.breaker.state)
+        actual = str(application.Response(tapas_interface.call_model_api({})))
+        self.assertEqual(communication.network.CIRCUIT_OPEN_ERROR, actual)
+
+    def test_givenOpenCircuitAfterResetTimeout_thenProbeClosesIt(self):
+        for _ in range(2):
+            self.breaker.record(False)
+        tapas_interface = self.tapas_interface()
+        self.now = 29.0
+        self.assertIn("error", tapas_interface.call_model_api({}))
+        self.now = 30.0
+        self.assertEqual("SUM > 1sqft", tapas_interface.call_model_api({})["answer"])
+        self.assertEqual("closed", self.breaker.state)
+
+    def test_givenHalfOpenCircuit_thenOnlyOneProbeIsAllowed(self):
+        for _ in range(2):
+            self.breaker.record(False)
+        self.now = 30.0
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(False)
+        self.assertEqual("open", self.breaker.state)
+
+    def test_givenSlowAnswers_thenTheyCountAsFailures(self):
+        for _ in range(2):
+            self.breaker.record(True, duration=0.5)
+        self.assertEqual("open", self.breaker.state)
+
+    def test_givenLoadingOrInputErrors_thenTheyDontCount(self):
+        for error in ("Model is currently loading", "table is empty"):
+            self.assertFalse(
+                communication.network.is_upstream_failure({"error": error})
+            )
+        self.assertTrue(communication.network.is_upstream_failure({"error": "Boom"}))
+
+    def test_givenFullBulkhead_thenCallIsRefused(self):
+        _StandInModel.delay = 0.3
+        tapas_interface = self.tapas_interface(
+            timeout=(1.0, 1.0), bulkhead=communication.network.Bulkhead(1)
+        )
+        first = threading.Thread(target=tapas_interface.call_model_api, args=({},))
+        first.start()
+        while not _StandInModel.clients:
+            time.sleep(0.01)
+        actual = tapas_interface.call_model_api({})
+        first.join()
+        self.assertEqual(communication.network.BULKHEAD_FULL_ERROR, actual["error"])
+        self.assertIn("answer", tapas_interface.call_model_api({}))
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.rate_limiter = communication.network.RateLimiter(
+            rate=2.0, burst=3, max_queue=2, max_wait=1.0, clock=lambda: self.now
+        )
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def test_givenBurst_thenCallsGoThroughWithoutWaiting(self):
+        self.assertEqual(
+            [0.0, 0.0, 0.0], [self.rate_limiter.reserve() for _ in range(3)]
+        )
+
+    def test_givenEmptyBucket_thenCallsQueueForNextTokens(self):
+        for _ in range(3):
+            self.rate_limiter.reserve()
+        self.assertEqual([0.5, 1.0], [self.rate_limiter.reserve() for _ in range(2)])
+        self.assertEqual(2, self.rate_limiter.stats().waiting)
+
+    def test_givenFullQueueOrLongWait_thenCallIsRejected(self):
+        for _ in range(5):
+            self.rate_limiter.reserve()
+        self.assertIsNone(self.rate_limiter.reserve())
+        self.rate_limiter.done_waiting(0.5)
+        self.assertIsNone(self.rate_limiter.reserve())
+        self.assertEqual(2, self.rate_limiter.stats().rejected)
+
+    def test_givenSteadyDemand_thenThroughputStaysAtRate(self):
+        admitted = 0
+        while self.now < 60.0:
+            if self.rate_limiter.acquire(sleep=self.sleep):
+                admitted += 1
+        self.assertEqual(3 + 2 * 60, admitted)
+        stats = self.rate_limiter.stats()
+        self.assertEqual((admitted, 0, 0), stats[:3])
+        self.assertEqual(0.5, stats.max_wait)
+
+    def test_givenOpenCircuit_thenCallFailsFastWithoutToken(self):
+        for _ in range(3):
+            self.rate_limiter.reserve()
+        breaker = communication.network.CircuitBreaker(failure_threshold=1)
+        breaker.record(False)
+        tapas_interface = communication.TapasInterface(
+            "token",
+            full_url="http://127.0.0.1:1/model",
+            breaker=breaker,
+            rate_limiter=self.rate_limiter,
+        )
+        started = time.perf_counter()
+        actual = tapas_interface.call_model_api({})
+        self.assertLess(time.perf_counter() - started, 0.1)
+        self.assertEqual(communication.network.CIRCUIT_OPEN_ERROR, actual["error"])
+        self.assertEqual((3, 0, 0), self.rate_limiter.stats()[:3])
+
+    def test_givenFullBulkhead_thenTokenIsRefunded(self):
+        bulkhead = communication.network.Bulkhead(1)
+        bulkhead.acquire()
+        tapas_interface = communication.TapasInterface(
+            "token",
+            full_url="http://127.0.0.1:1/model",
+            breaker=communication.network.CircuitBreaker(),
+            bulkhead=bulkhead,
+            rate_limiter=self.rate_limiter,
+        )
+        actual = tapas_interface.call_model_api({})
+        self.assertEqual(communication.network.BULKHEAD_FULL_ERROR, actual["error"])
+        self.assertEqual(0, self.rate_limiter.stats().admitted)
+        self.assertEqual([0.0] * 3, [self.rate_limiter.reserve() for _ in range(3)])
+
+    def test_givenProbeRejectedByLimiter_thenNextCallMayProbe(self):
+        for _ in range(5):
+            self.rate_limiter.reserve()
+        breaker = communication.network.CircuitBreaker(
+            failure_threshold=1, reset_timeout=0.0
+        )
+        breaker.record(False)
+        tapas_interface = communication.TapasInterface(
+            "token",
+            full_url="http://127.0.0.1:1/model",
+            breaker=breaker,
+            rate_limiter=self.rate_limiter,
+        )
+        actual = tapas_interface.call_model_api({})
+        self.assertEqual(communication.network.RATE_LIMITED_ERROR, actual["error"])
+        self.assertEqual("open", breaker.state)
+        self.assertTrue(breaker.allow())
+
+    def test_givenRejectedCall_thenModelIsNotCalled(self):
+        for _ in range(5):
+            self.rate_limiter.reserve()
+        tapas_interface = communication.TapasInterface(
+            "token", full_url="http://127.0.0.1:1/model", rate_limiter=self.rate_limiter
+        )
+        actual = str(application.Response(tapas_interface.call_model_api({})))
+        self.assertEqual(communication.network.RATE_LIMITED_ERROR, actual)
+
+
+class _AsyncStandInModel:
+    """Answers after a delay, or says it is loading for the first few calls
+
+    Connections are kept open for further requests until the client closes them.
+    """
+
+    def __init__(self, delay=0.0, loading_calls=0, chunked=False):
+        self.delay = delay
+        self.loading_calls = loading_calls
+        self.chunked = chunked
+        self.in_flight = self.max_in_flight = self.calls = self.connections = 0
+        self.writers = set()
+
+    def close_connections(self):
+        for writer in self.writers:
+            writer.close()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.writers.add(writer)
+        try:
+            while await reader.readline():
+                await self.answer(reader, writer)
+        except (ConnectionError, asyncio.CancelledError):
+            # The client went away, or the test ended while a call was in flight
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def answer(self, reader, writer):
+        headers = dict()
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        payload = json.loads(await reader.readexactly(int(headers["content-length"])))
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        if self.calls <= self.loading_calls:
+            model_response = {
+                "error": "Model google/tapas-large-finetuned-wtq is currently loading",
+                "estimated_time": 0.01,
+            }
+        else:
+            model_response = {"answer": f"SUM > {payload['inputs']['query']}"}
+        body = json.dumps(model_response).encode()
+        if self.chunked:
+            writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n")
+            for start in range(0, len(body), 7):
+                chunk = body[start : start + 7]
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            writer.write(b"0\r\n\r\n")
+        else:
+            writer.write(b"HTTP/1.1 503 Service Unavailable\r\n")
+            writer.write(b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+        await writer.drain()
+
+
+class TestAsyncTapasInterface(unittest.IsolatedAsyncioTestCase):
+    async def serve(self, stand_in):
+        server = await asyncio.start_server(stand_in.handle, "127.0.0.1", 0)
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        self.addCleanup(stand_in.close_connections)
+        return f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/model"
+
+    def interface(self, full_url, **kwargs):
+        kwargs.setdefault("rate_limiter", _unlimited())
+        tapas_interface = communication.AsyncTapasInterface(
+            "token", full_url=full_url, **kwargs
+        )
+        self.addCleanup(tapas_interface.close)
+        return tapas_interface
+
+    @staticmethod
+    def payload(number):
+        return {"inputs": {"query": str(number), "table": {}}}
+
+    async def test_givenManyCalls_thenTheyAreInFlightTogetherUpToLimit(self):
+        stand_in = _AsyncStandInModel(delay=0.2)
+        tapas_interface = self.interface(await self.serve(stand_in), max_concurrency=16)
+        started = time.perf_counter()
+        answers = await asyncio.gather(
+            *(tapas_interface.call_model_api(self.payload(n)) for n in range(64))
+        )
+        elapsed = time.perf_counter() - started
+        self.assertEqual(
+            [f"SUM > {n}" for n in range(64)], [a["answer"] for a in answers]
+        )
+        self.assertEqual(16, stand_in.max_in_flight)
+        # One call at a time would take 13 seconds
+        self.assertLess(elapsed, 8.0)
+
+    async def test_givenCallsOneAfterAnother_thenConnectionIsReused(self):
+        stand_in = _AsyncStandInModel()
+        tapas_interface = self.interface(await self.serve(stand_in))
+        for n in range(3):
+            actual = await tapas_interface.call_model_api(self.payload(n))
+            self.assertEqual({"answer": f"SUM > {n}"}, actual)
+        self.assertEqual(1, stand_in.connections)
+
+    async def test_givenSlowModel_thenCallTimesOutWithError(self):
+        stand_in = _AsyncStandInModel(delay=0.5)
+        tapas_interface = self.interface(
+            await self.serve(stand_in),
+            timeout=(1.0, 0.1),
+            breaker=communication.network.CircuitBreaker(),
+        )
+        actual = await tapas_interface.call_model_api(self.payload(1))
+        self.assertEqual({"error": communication.network.TIMEOUT_ERROR}, actual)
+
+    async def test_givenOpenCircuit_thenCallFailsFastWithoutToken(self):
+        rate_limiter = _unlimited()
+        breaker = communication.network.CircuitBreaker(failure_threshold=1)
+        breaker.record(False)
+        tapas_interface = self.interface(
+            "http://127.0.0.1:1/model", breaker=breaker, rate_limiter=rate_limiter
+        )
+        actual = await tapas_interface.call_model_api(self.payload(1))
+        self.assertEqual({"error": communication.network.CIRCUIT_OPEN_ERROR}, actual)
+        self.assertEqual(0, rate_limiter.stats().admitted)
+
+    async def test_givenChunkedResponse_thenBodyIsJoined(self):
+        stand_in = _AsyncStandInModel(chunked=True)
+        tapas_interface = self.interface(await self.serve(stand_in))
+        actual = await tapas_interface.call_model_api(self.payload(7))
+        self.assertEqual({"answer": "SUM > 7"}, actual)
+
+    async def test_givenLoadingModel_thenAsyncRetriesGetAnswer(self):
+        stand_in = _AsyncStandInModel(loading_calls=2)
+        tapas_interface = self.interface(await self.serve(stand_in))
+        policy = application.retry.RetryPolicy(initial_delay=0.01, deadline=5.0)
+        actual = await application.retry.call_with_retries_async(
+            tapas_interface.call_model_api, self.payload(3), policy
+        )
+        self.assertEqual({"answer": "SUM > 3"}, actual)
+        self.assertEqual(3, stand_in.calls)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        secs_since_epoch = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        self.test_dir = Path(f"./{secs_since_epoch}_test_response_cache")
+        self.now = 1000.0
+        self.answer = {"answer": "SUM > 1sqft, 2sqft", "aggregator": "SUM"}
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def cache(self, max_entries=2, directory=None):
+        return communication.ResponseCache(
+            max_entries, 60.0, directory, clock=lambda: self.now
+        )
+
+    def test_givenEqualTablesInAnyKeyOrder_thenCacheKeysAreEqual(self):
+        key = communication.response_cache.cache_key
+        first = key("q", {"crop": ["cress"], "quantity": ["1sqft"]})
+        second = key("q", {"quantity": ["1sqft"], "crop": ["cress"]})
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, key("q", {"crop": ["cress"], "quantity": ["2sqft"]}))
+
+    def test_givenFullCache_thenLeastRecentlyUsedIsEvicted(self):
+        cache = self.cache()
+        cache.put("a", self.answer)
+        cache.put("b", self.answer)
+        cache.get("a")
+        cache.put("c", self.answer)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(self.answer, cache.get("a"))
+        self.assertEqual((2, 0, 1, 2), tuple(cache.stats()))
+
+    def test_givenExpiredEntry_thenItIsAMiss(self):
+        cache = self.cache()
+        cache.put("a", self.answer)
+        self.now += 61.0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(1, cache.stats().misses)
+
+    def test_givenDiskTier_thenNewCacheFindsEarlierAnswers(self):
+        self.cache(directory=self.test_dir).put("a", self.answer)
+        restarted = self.cache(directory=self.test_dir)
+        self.assertEqual(self.answer, restarted.get("a"))
+        self.assertEqual(self.answer, restarted.get("a"))
+        self.assertEqual((1, 1, 0, 1), tuple(restarted.stats()))
+
+    def test_givenExpiredFileOnDisk_thenItIsDeleted(self):
+        self.cache(directory=self.test_dir).put("a", self.answer)
+        self.now += 61.0
+        self.assertIsNone(self.cache(directory=self.test_dir).get("a"))
+        self.assertEqual([], list(self.test_dir.iterdir()))
+
+    def test_givenMoreFilesThanEntries_thenOldestAreDeleted(self):
+        cache = self.cache(directory=self.test_dir)
+        for key in "abc":
+            cache.put(key, self.answer)
+            time.sleep(0.01)
+        self.assertEqual(
+            ["b.json", "c.json"], sorted(path.name for path in self.test_dir.iterdir())
+        )
+
+
+class TestDataGeneration(unittest.TestCase):
+    def setUp(self):
+        secs_since_epoch = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        self.test_path = Path(f"./{secs_since_epoch}_test_generation.csv")
+        shutil.copy(application.config.MOCK_DATA_SMALL, self.test_path)
+
+    def tearDown(self):
+        self.test_path.unlink()
+        communication.snapshot.snapshot_path(self.test_path).unlink(missing_ok=True)
+
+    def test_givenUnchangedFile_thenGenerationStaysTheSame(self):
+        first = communication.persistence.data_generation(self.test_path)
+        second = communication.persistence.data_generation(self.test_path)
+        self.assertEqual(first, second)
+
+    def test_givenPersistedEvent_thenGenerationGoesUp(self):
+        before = communication.persistence.data_generation(self.test_path)
+        communication.persist_event(mock_data[0], self.test_path, fieldnames)
+        after = communication.persistence.data_generation(self.test_path)
+        self.assertGreater(after, before)
+
+    def test_givenCompaction_thenGenerationGoesUp(self):
+        before = communication.persistence.data_generation(self.test_path)
+        communication.persistence.compact(self.test_path)
+        after = communication.persistence.data_generation(self.test_path)
+        self.assertGreater(after, before)
+
+    def test_givenStampedResponse_thenOtherGenerationsMiss(self):
+        cache = communication.ResponseCache(4, 60.0)
+        cache.put("key", {"answer": "3sqft"}, generation=1)
+        self.assertEqual({"answer": "3sqft"}, cache.get("key", generation=1))
+        self.assertIsNone(cache.get("key", generation=2))
@@ -1,5 +1,7 @@
+import re
+import time
 import unittest
-from speak_to_data import presentation
+from speak_to_data import application, presentation
 from flask_wtf import FlaskForm
 
 
@@ -11,6 +13,71 @@ class TestFlaskApplication(unittest.TestCase):
         self.assertTrue(self.client.get("/sow"))
 
 
+class TestStats(unittest.TestCase):
+    def test_givenRunningServer_thenStatsComeFromItsCounters(self):
+        client = presentation.flask_app.test_client()
+        application.response_cache.get("not cached")
+        stats = client.get("/stats").json
+        self.assertEqual(
+            application.response_cache.stats().misses, stats["response_cache"]["misses"]
+        )
+        self.assertEqual(
+            {"pid", "response_cache", "shared_model_calls", "rate_limiter", "circuit"},
+            set(stats),
+        )
+        self.assertIn("waiting", stats["rate_limiter"])
+
+
+class TestCompactEvents(unittest.TestCase):
+    def setUp(self):
+        self.backend = application.config.PERSISTENCE_BACKEND
+
+    def tearDown(self):
+        application.config.PERSISTENCE_BACKEND = self.backend
+
+    def test_givenSqliteBackend_thenCommandFailsWithMessage(self):
+        application.config.PERSISTENCE_BACKEND = "sqlite"
+        runner = presentation.flask_app.test_cli_runner()
+        result = runner.invoke(args=["compact-events"])
+        self.assertEqual(1, result.exit_code)
+        self.assertIn("sqlite backend does not support compaction", result.output)
+        self.assertNotIn("Traceback", result.output)
+
+
+class TestQueryJobs(unittest.TestCase):
+    def setUp(self):
+        presentation.flask_app.config["WTF_CSRF_ENABLED"] = False
+        self.client = presentation.flask_app.test_client()
+        self.answer_query = application.answer_query
+        self.query_jobs = application.query_jobs
+        application.answer_query = lambda user_query: f"answer to {user_query}"
+        application.query_jobs = application.jobs.JobQueue(2, 16, 16)
+
+    def tearDown(self):
+        application.answer_query = self.answer_query
+        application.query_jobs = self.query_jobs
+
+    def test_givenQuery_thenAnswerIsPolledFromJobEndpoint(self):
+        page = self.client.post("/", data={"user_query": "how much cress?"}).text
+        (job_url,) = re.findall(r"fetch\('([^']+)'\)", page)
+        job = self.client.get(job_url).json
+        while job["state"] == "pending":
+            time.sleep(0.01)
+            job = self.client.get(job_url).json
+        self.assertEqual(
+            {"state": "done", "response": "answer to how much cress?"}, job
+        )
+
+    def test_givenFullJobQueue_thenQueryIsTurnedAway(self):
+        application.query_jobs = application.jobs.JobQueue(1, 16, 0)
+        page = self.client.post("/", data={"user_query": "how much cress?"}).text
+        self.assertIn("Too many questions", page)
+        self.assertNotIn("fetch(", page)
+
+    def test_givenUnknownJob_thenNotFound(self):
+        self.assertEqual(404, self.client.get("/jobs/nope").status_code)
+
+
 class TestFlaskForms(unittest.TestCase):
     @staticmethod
     def _get_form_fields(form: FlaskForm) -> set[tuple[str, str]]: